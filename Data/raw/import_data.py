@@ -1,61 +1,82 @@
 # Install dependencies as needed:
-# pip install kagglehub[pandas-datasets]
-from kagglehub import KaggleDatasetAdapter, load_dataset
+# pip install kagglehub
+import argparse
 import os
-import pandas as pd
+import shutil
+import sys
+from pathlib import Path
+
+import kagglehub
+
+# Le schéma du store est partagé avec l'application
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src" / "mange_ta_main"))
+from utils.aggregates import build_aggregates  # noqa: E402
+from utils.ingest import DEFAULT_MEMORY_LIMIT_MB, format_stats, ingest_csv, sync_csv  # noqa: E402
+from utils.nutrition_clusters import update_nutrition_clusters  # noqa: E402
+
+DATASET = "shuyangli94/food-com-recipes-and-user-interactions"
 
 # Paths
 os.makedirs("Data", exist_ok=True)  # crée Data/ si nécessaire
-recipes_csv_path = "Data/RAW_recipes_local.csv"
-recipes_pkl_path = "Data/RAW_recipes_local.pkl"
-interactions_csv_path = "Data/RAW_interactions_local.csv"
-interactions_pkl_path = "Data/RAW_interactions_local.pkl"
-
-# Étape 1 : télécharger le CSV des recettes seulement s'il n'existe pas
-if not os.path.exists(recipes_csv_path):
-    print("CSV non trouvé, téléchargement.")
-    file_path = "RAW_recipes.csv"
-    df = load_dataset(
-        KaggleDatasetAdapter.PANDAS,
-        "shuyangli94/food-com-recipes-and-user-interactions",
-        file_path,
-    )
-    df.to_csv(recipes_csv_path, index=False)
-    print(f"CSV sauvegardé dans {recipes_csv_path}")
-else:
-    print("Recipes CSV déjà présent, lecture locale...")
-    df = pd.read_csv(recipes_csv_path)
+SOURCES = {
+    "recipes": ("RAW_recipes.csv", "Data/RAW_recipes_local.csv"),
+    "interactions": ("RAW_interactions.csv", "Data/RAW_interactions_local.csv"),
+}
 
 
-# Étape 2 : créer un pickle pour les interactions seulement s'il n'existe pas
-if not os.path.exists(recipes_pkl_path):
-    df.to_pickle(recipes_pkl_path)
-    print(f"Interactions pickle créé : {recipes_pkl_path}")
-else:
-    print("Interactions pickle déjà présent.")
-
-
-# Étape 3 : télécharger le CSV des intercations seulement s'il n'existe pas
-if not os.path.exists(interactions_csv_path):
-    print("Interactions CSV non trouvé, téléchargement.")
-    file_path = "RAW_interactions.csv"
-    df = load_dataset(
-        KaggleDatasetAdapter.PANDAS,
-        "shuyangli94/food-com-recipes-and-user-interactions",
-        file_path,
-    )
-    df.to_csv(interactions_csv_path, index=False)
-    print(f"CSV sauvegardé dans {interactions_csv_path}")
-else:
-    print("Interactions CSV déjà présent, lecture locale...")
-    df = pd.read_csv(interactions_csv_path)
-    
-# Étape 4 : créer un pickle pour les recipes seulement s'il n'existe pas
-if not os.path.exists(interactions_pkl_path):
-    df.to_pickle(interactions_pkl_path)
-    print(f"Interactions pickle créé : {interactions_pkl_path}")
+def fetch_csv(file_path, csv_path):
+    """Télécharge le CSV Kaggle seulement s'il n'existe pas (copie fichier, sans pandas)."""
+    if not os.path.exists(csv_path):
+        print(f"{file_path} non trouvé, téléchargement.")
+        shutil.copyfile(kagglehub.dataset_download(DATASET, path=file_path), csv_path)
+        print(f"CSV sauvegardé dans {csv_path}")
+    else:
+        print(f"{file_path} déjà présent.")
+
+
+parser = argparse.ArgumentParser(description="Construit le store Parquet à partir des CSV Kaggle.")
+parser.add_argument(
+    "--memory-limit",
+    type=float,
+    default=float(os.environ.get("MANGE_TA_MAIN_INGEST_MEMORY_MB", DEFAULT_MEMORY_LIMIT_MB)),
+    help="Plafond mémoire (MB) pour le traitement d'un chunk.",
+)
+parser.add_argument(
+    "--rebuild",
+    action="store_true",
+    help="Reconstruit tout le store au lieu d'ingérer seulement les nouvelles lignes.",
+)
+parser.add_argument(
+    "--append",
+    nargs=2,
+    metavar=("TABLE", "CSV"),
+    help="Ajoute un CSV delta (avec en-tête) comme nouvelle partition de TABLE.",
+)
+args = parser.parse_args()
+
+if args.append:
+    name, delta_path = args.append
+    print(format_stats(ingest_csv(delta_path, name, args.memory_limit, append=True)))
 else:
-    print("Interactions pickle déjà présent.")
+    for name, (file_path, csv_path) in SOURCES.items():
+        fetch_csv(file_path, csv_path)
+        # Lecture, normalisation et écriture chunk par chunk ; seules les lignes
+        # ajoutées au CSV depuis le dernier import sont traitées
+        if args.rebuild:
+            stats = ingest_csv(csv_path, name, memory_limit_mb=args.memory_limit)
+        else:
+            stats = sync_csv(csv_path, name, memory_limit_mb=args.memory_limit)
+        print(format_stats(stats))
+
+# Agrégats matérialisés : seuls ceux dont les tables sources ont changé
+# sont recalculés
+rebuilt = build_aggregates(force=args.rebuild)
+print(f"Agrégats recalculés : {', '.join(rebuilt) or 'aucun'}")
 
-# Aperçu
-print("First 5 records:", df.head())
+# Clusters nutritionnels : les nouvelles recettes sont affectées aux clusters
+# existants, le modèle n'est réajusté qu'après une reconstruction
+clusters = update_nutrition_clusters(force=args.rebuild)
+print(
+    f"Clusters nutritionnels : {'réajustés' if clusters['refitted'] else 'modèle conservé'}, "
+    f"{clusters['assigned']:,} recettes affectées"
+)
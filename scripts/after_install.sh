@@ -6,4 +6,4 @@ echo "Running post-installation script..." >> /home/admin/hook.log
 echo "Current date and time: $current_datetime" >> /home/admin/hook.log
 echo "----"
 
-# /home/admin/.local/bin/hatch run production:init_data &>> /home/admin/hook.log
+# /home/admin/.local/bin/hatch run production:init_data -- --memory-limit 256 &>> /home/admin/hook.log
@@ -2,7 +2,7 @@ import streamlit as st
 from streamlit_option_menu import option_menu
 
 from utils.sidebar import kaggle_link
-from utils.data_loader import load_recipes, load_interactions
+from utils.data_loader import scan_recipes, scan_interactions
 from utils.navbar import hide_page_navbar
 from utils.navbar import nav
 from assets import CAMENBEAR
@@ -24,8 +24,10 @@ st.sidebar.image(CAMENBEAR, width="stretch")
 # =========================================================================
 # Load data
 # =========================================================================
-df_recipes = load_recipes()
-df_interactions = load_interactions()
+# Seules les premières lignes sont lues : les colonnes texte complètes ne
+# sont jamais chargées pour cet aperçu
+df_recipes = scan_recipes()
+df_interactions = scan_interactions()
 
 # =========================================================================
 # Display basic info
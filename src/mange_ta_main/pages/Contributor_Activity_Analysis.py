@@ -4,11 +4,21 @@
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import streamlit as st
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 
-from utils.data_loader import load_recipes
+from utils.activity import (
+    ActivityMatrix,
+    activity_features,
+    clustering_scores,
+    submit_activity_clusterings,
+    super_core_sweep,
+)
+from utils.aggregates import source_versions
+from utils.charts import lorenz_figure
+from utils.data_loader import cache_shared, load_aggregate, load_concentration, load_recipes
+from utils.disk_cache import disk_cache
+from utils.executor import background, report_progress, wait_for
 from utils.sidebar import kaggle_link
 from utils.logger import logger
 from utils.navbar import hide_page_navbar
@@ -31,7 +41,7 @@ st.sidebar.image(CAMENBEAR, width="stretch")
 #             DATA LOADING
 # ==========================================================
 
-df_recipes = load_recipes()
+df_recipes = load_recipes(["contributor_id", "id", "submitted"])
 
 
 # ==========================================================
@@ -63,7 +73,23 @@ allowing targeted interventions for maximum impact in a public health context.
 st.sidebar.header("Clustering Parameters")
 
 # --- Clustering parameter (only one kept) ---
-n_clusters = st.sidebar.slider("Number of clusters", 2, 8, 3)
+CLUSTER_RANGE = range(2, 9)
+n_clusters = st.sidebar.slider("Number of clusters", CLUSTER_RANGE[0], CLUSTER_RANGE[-1], 3)
+
+# --- Super core thresholds (looked up in a precomputed sweep) ---
+SWEEP_CUTOFFS = [f"{year}-01-01" for year in range(2009, 2017)]
+SWEEP_MIN_ACTIVE_MONTHS = list(range(1, 25))
+SWEEP_PERCENTILES = [0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 0.99]
+SWEEP_LATE_SHARES = [round(share, 2) for share in np.arange(0, 0.95, 0.05)]
+
+st.sidebar.header("Super Core Thresholds")
+cutoff = st.sidebar.select_slider(
+    "Still active after", SWEEP_CUTOFFS, "2013-01-01", format_func=lambda d: d[:4])
+min_active_months = st.sidebar.slider("Min. active months (2008–2014)", 1, 24, 6)
+percentile_min_recipes = st.sidebar.select_slider(
+    "Min. recipes (percentile)", SWEEP_PERCENTILES, 0.9, format_func=lambda p: f"P{p*100:.0f}")
+min_late_share = st.sidebar.select_slider(
+    "Min. share of recipes after cutoff", SWEEP_LATE_SHARES, 0.3, format_func=lambda s: f"{s:.0%}")
 
 
 # ==========================================================
@@ -71,45 +97,27 @@ n_clusters = st.sidebar.slider("Number of clusters", 2, 8, 3)
 # ==========================================================
 st.subheader("A.1 Contribution Concentration — Lorenz Curve")
 
-nb_recipes_contributor = df_recipes['contributor_id'].value_counts()
-total_recipes = nb_recipes_contributor.sum()
-total_contributors = nb_recipes_contributor.size
+# Sorted once per dataset: Lorenz curve, top shares and Gini come from the same array
+concentration = load_concentration("contributor_recipes", "n_recipes")
+total_recipes = int(concentration.total)
+total_contributors = concentration.n
 
 # Fixed 10% threshold (no interactivity)
-k_top = max(1, int(np.floor(0.10 * total_contributors)))
-share_top10 = nb_recipes_contributor.sort_values(ascending=False).head(k_top).sum() / total_recipes
-
-# Lorenz curve
-counts_sorted = np.sort(nb_recipes_contributor.values)
-cum_recipes = np.cumsum(counts_sorted) / counts_sorted.sum()
-cum_contributors = np.arange(1, len(counts_sorted) + 1) / len(counts_sorted)
+share_top10 = concentration.top_share(0.10)
 
 # Display metrics
-col1, col2, col3 = st.columns(3)
+col1, col2, col3, col4 = st.columns(4)
 col1.metric("Number of contributors", f"{total_contributors:,}".replace(",", " "))
 col2.metric("Number of recipes", f"{total_recipes:,}".replace(",", " "))
 col3.metric("Share of recipes (Top 10%)", f"{share_top10*100:.1f}%")
+col4.metric("Gini coefficient", f"{concentration.gini():.2f}")
 
-# Plot Lorenz
-fig = go.Figure()
-fig.add_trace(go.Scatter(
-    x=cum_contributors,
-    y=cum_recipes,
-    name="Contribution Distribution",))
-fig.add_trace(go.Scatter(
-    x=[0,1],
-    y=[0,1],
-    name="Perfect Equality",
-    line={
-        "color": "orange",
-        "width":1,
-        "dash": "dash"
-    }))
-
-fig.update_layout(
+# Plot Lorenz (downsampled curve)
+fig = lorenz_figure(
+    {"Contribution Distribution": concentration},
     title="Lorenz Curve — Contribution Inequality",
-    xaxis_title="Cumulative share of contributors",
-    yaxis_title="Cumulative share of recipes")
+    x_title="Cumulative share of contributors",
+    y_title="Cumulative share of recipes")
 
 st.plotly_chart(fig)
 
@@ -125,78 +133,28 @@ st.markdown(f"""
 #                 PART 2: CLUSTERING & SUPER CORE
 # ==========================================================
 
-def build_activity_matrix(df: pd.DataFrame, freq="M") -> pd.DataFrame:
-    df = df.copy()
-    df["submitted"] = pd.to_datetime(df["submitted"], errors="coerce")
-    df["month"] = df["submitted"].dt.to_period(freq).dt.to_timestamp()
-    return (
-        df.groupby(["contributor_id", "month"])["id"]
-          .nunique()
-          .unstack(fill_value=0)
-          .sort_index(axis=1)
-    )
-
-
-def filter_top_contributors(df: pd.DataFrame, top_n=277) -> pd.DataFrame:
-    top_authors = (
-        df.groupby("contributor_id")["id"]
-          .nunique()
-          .sort_values(ascending=False)
-          .head(top_n)
-          .index
-    )
-    return df[df["contributor_id"].isin(top_authors)]
-
-
-def prepare_activity_data(df: pd.DataFrame, top_n=277) -> pd.DataFrame:
-    df_top = filter_top_contributors(df, top_n)
-    return build_activity_matrix(df_top)
-
+def prepare_activity_data(monthly: pd.DataFrame, top_n=277) -> ActivityMatrix:
+    """Sparse activity matrix of the ``top_n`` contributors (all of them if None)."""
+    activity = ActivityMatrix.from_monthly(monthly)
+    return activity if top_n is None else activity.top(top_n)
 
-def perform_activity_clustering(activity, n_clusters=3, window=3, random_state=42):
-    """Perform KMeans clustering using Z-score normalization."""
-    smoothed = activity.T.rolling(window=window, min_periods=1).mean().T
-
-    X = StandardScaler().fit_transform(smoothed)  # Z-score normalization
-
-    km = KMeans(n_clusters=n_clusters, random_state=random_state)
-    labels = km.fit_predict(X)
-
-    activity_clustered = activity.copy()
-    activity_clustered["cluster"] = labels
-    return activity_clustered, km, len(set(labels))
-
-
-def compute_super_core_metrics(activity, cutoff="2013-01-01", active_window=("2008-01-01", "2014-12-31")):
-    START, END = pd.Timestamp(active_window[0]), pd.Timestamp(active_window[1])
-    CUTOFF = pd.Timestamp(cutoff)
-
-    total_recipes = activity.sum(axis=1)
-    active_months = activity.loc[:, (activity.columns >= START) & (activity.columns <= END)].gt(0).sum(axis=1)
-
-    last_pub = activity.apply(lambda row: row[row > 0].index.max() if (row > 0).any() else pd.NaT, axis=1)
-    late_cols = [c for c in activity.columns if c >= CUTOFF]
-    late_share = activity[late_cols].sum(axis=1) / total_recipes.replace(0, np.nan)
 
+def compute_super_core_metrics(activity: ActivityMatrix, cutoff="2013-01-01", active_window=("2008-01-01", "2014-12-31")):
     return pd.DataFrame({
-        "total_recipes": total_recipes,
-        "active_months": active_months,
-        "last_pub": last_pub,
-        "late_share": late_share.fillna(0)
-    })
+        "total_recipes": activity.totals(),
+        "active_months": activity.active_months(*active_window),
+        "last_pub": activity.last_active(),
+        "late_share": activity.late_share(cutoff),
+    }, index=activity.contributors)
 
 
 def identify_super_core(df_recipes,
-                        activity_clustered,
-                        activity_matrix=None,
+                        activity_matrix,
                         cutoff="2013-01-01",
                         active_window=("2008-01-01", "2014-12-31"),
                         min_active_months=6,
                         percentile_min_recipes=0.90,
                         min_late_share=0.30):
-    if activity_matrix is None:
-        activity_matrix = activity_clustered.drop(columns=["cluster"])
-
     metrics = compute_super_core_metrics(activity_matrix, cutoff, active_window)
     min_recipes = np.nanpercentile(metrics["total_recipes"], percentile_min_recipes * 100)
 
@@ -227,63 +185,112 @@ def identify_super_core(df_recipes,
     }
 
 
-def summarize_temporal_clustering(df_recipes: pd.DataFrame, top_n=277, n_clusters=3):
-    """Full pipeline: prepare data, cluster, and identify super core contributors."""
-
-    df = df_recipes.copy()
-    df["submitted"] = pd.to_datetime(df["submitted"], errors="coerce")
-    df = df.sort_values("submitted")
+@background
+@disk_cache(tables=["recipes"])
+def summarize_temporal_clustering(df: pd.DataFrame, top_n=277):
+    """Prepare the activity matrix and identify super core contributors."""
 
-    activity = prepare_activity_data(df, top_n)
-    activity_clustered, model, n_clusters_found = perform_activity_clustering(activity, n_clusters)
-    super_core_info = identify_super_core(df, activity_clustered, activity_matrix=activity)
+    report_progress(0.1, "Building the activity matrix")
+    activity = prepare_activity_data(load_aggregate("contributor_months"), top_n)
+    report_progress(0.5, "Identifying the super core")
+    super_core_info = identify_super_core(df, activity)
 
     n_recipes_sc = df[df["contributor_id"].isin(super_core_info["super_core"])].shape[0]
     share_sc = n_recipes_sc / df.shape[0] if df.shape[0] > 0 else 0
 
     return {
         "activity_matrix": activity,
-        "activity_clustered": activity_clustered,
-        "cluster_model": model,
-        "n_clusters": n_clusters_found,
         "super_core_info": super_core_info,
         "super_core_recipe_share": share_sc
     }
 
 
+@cache_shared
+def compute_super_core_sweep(versions: dict, top_n=277, n_recipes_total=None):
+    """Super-core size and recipe share for every threshold of the sidebar.
+
+    ``versions`` (the aggregate's source versions) only keys the cache, so
+    an appended dataset is swept again.
+    """
+    activity = prepare_activity_data(load_aggregate("contributor_months"), top_n)
+    return super_core_sweep(
+        activity,
+        SWEEP_CUTOFFS,
+        SWEEP_MIN_ACTIVE_MONTHS,
+        SWEEP_PERCENTILES,
+        SWEEP_LATE_SHARES,
+        n_recipes_total=n_recipes_total,
+    ).set_index(["cutoff", "min_active_months", "percentile_min_recipes", "min_late_share"])
+
+
+@cache_shared
+def compute_activity_features(versions: dict, top_n=277, window=3):
+    """Clustering features of the top contributors, built once per dataset.
+
+    ``versions`` (the aggregate's source versions) only keys the cache.
+    """
+    activity = prepare_activity_data(load_aggregate("contributor_months"), top_n)
+    return activity_features(activity, window)
+
+
 # ==========================================================
 #               PIPELINE EXECUTION
 # ==========================================================
-with st.spinner("Computing activity clusters..."):
-    results = summarize_temporal_clustering(df_recipes, n_clusters=n_clusters)
-
-activity = results["activity_clustered"]
-model = results["cluster_model"]
-super_core_info = results["super_core_info"]
-super_core_share = results["super_core_recipe_share"]
+# Both run in the background pool, shared by the sessions asking for them;
+# their charts are drawn once they are done, the rest of the page right away
+# df_recipes holds only the columns used by the pipeline, which also keeps the disk cache key cheap
+summary = summarize_temporal_clustering(df_recipes)
+features = compute_activity_features(source_versions("contributor_months"))
+# Every configuration of the slider is fitted concurrently; moving the
+# slider is then a lookup
+clusterings = submit_activity_clusterings(features, CLUSTER_RANGE)
 
 # ==========================================================
 #               CLUSTER VISUALIZATION
 # ==========================================================
 st.subheader("A.2 Average Normalized Activity Over Time")
 
-activity_cols = activity.columns[:-1]  # exclude cluster column
-fig = go.Figure()
-
-for c in range(results["n_clusters"]):
+results = wait_for({"summary": summary, "clustering": clusterings[n_clusters]}, "Computing activity clusters...")
+if results is not None:
+    activity_cols = results["summary"]["activity_matrix"].months
+    clustering = results["clustering"]
+    fig = go.Figure()
+
+    for c in range(clustering["n_clusters"]):
+        fig.add_trace(
+            go.Scatter(
+                x=activity_cols,
+                y=clustering["centroids"][c],
+                name=f"Cluster {c}")
+        )
+
+    fig.update_layout(
+        title="Average Normalized Activity Evolution (per cluster)",
+        xaxis_title="Month",
+        yaxis_title="Z-Score Activity Index")
+
+    st.plotly_chart(fig)
+
+st.subheader("A.3 Choosing the Number of Clusters")
+
+# Every configuration is fitted in the background, so the scores come for free
+if wait_for(clusterings, "Fitting the other configurations...") is not None:
+    scores = clustering_scores(clusterings)
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
     fig.add_trace(
-        go.Scatter(
-            x=activity_cols,
-            y=model.cluster_centers_[c],
-            name=f"Cluster {c}")
-    )
-
-fig.update_layout(
-    title="Average Normalized Activity Evolution (per cluster)",
-    xaxis_title="Month",
-    yaxis_title="Z-Score Activity Index")
+        go.Scatter(x=scores.index, y=scores["inertia"], name="Inertia (elbow)"),
+        secondary_y=False)
+    fig.add_trace(
+        go.Scatter(x=scores.index, y=scores["silhouette"], name="Silhouette score"),
+        secondary_y=True)
+    fig.add_vline(x=n_clusters, line={"color": "gray", "dash": "dash"})
+    fig.update_layout(
+        title="Inertia and Silhouette Score per Number of Clusters",
+        xaxis_title="Number of clusters")
+    fig.update_yaxes(title_text="Inertia", secondary_y=False)
+    fig.update_yaxes(title_text="Silhouette score", secondary_y=True)
 
-st.plotly_chart(fig)
+    st.plotly_chart(fig)
 
 # ==========================================================
 #               SUPER CORE ANALYSIS
@@ -314,28 +321,53 @@ as it reveals **three well-defined groups of contributors** over time.
 """)
 
 # ==========================================================
-#               CONCLUSION
+#               SUPER CORE SENSITIVITY
 # ==========================================================
 
-st.header("C. Conclusion contributor Behavior and Temporal Analysis")
+st.subheader("B.2 Sensitivity of the Super Core to its Thresholds")
 
-col1, col2, col3 = st.columns(3)
-col1.metric("Contributors (P99)", "277")
-col2.metric("Clusters 1 & 2 (4-cluster setup)", "38")
-col3.metric("Active in last 6 months", "35")
+# Every combination of thresholds is evaluated once; the sidebar only looks results up
+sweep = compute_super_core_sweep(source_versions("contributor_months"), n_recipes_total=len(df_recipes))
+selected = sweep.loc[(cutoff, min_active_months, percentile_min_recipes, min_late_share)]
 
-"""
-By focusing on the **two most active clusters (1 and 2)** — corresponding to the platform’s maturity phase (2007–2015):
-- among the **277 contributors in the 99th percentile (P99)**, **38 major contributors** were identified;  
-- applying an additional criterion of **recent activity (within the last six months)** 
-  further narrows this group down to **35 key contributors**.
+grid = sweep.xs((cutoff, percentile_min_recipes), level=["cutoff", "percentile_min_recipes"])
+grid = grid["n_super_core"].unstack("min_late_share")
+fig = go.Figure(go.Heatmap(
+    x=[f"{s:.0%}" for s in grid.columns],
+    y=grid.index,
+    z=grid.to_numpy(),
+    colorbar={"title": "Contributors"}))
+fig.update_layout(
+    title=f"Super core size (still active after {cutoff[:4]}, at least P{percentile_min_recipes*100:.0f} recipes)",
+    xaxis_title="Min. share of recipes after cutoff",
+    yaxis_title="Min. active months (2008–2014)")
 
-These 35 contributors form the **strategic core to retain, support, and guide** 
-in promoting **public health objectives** and improving the **nutritional quality** of the recipes shared on the platform.
+st.plotly_chart(fig)
 
-"""
+# ==========================================================
+#               CONCLUSION
+# ==========================================================
 
+st.header("C. Conclusion contributor Behavior and Temporal Analysis")
 
+n_top = len(features)
+n_super_core = int(selected["n_super_core"])
+n_recent = int(selected["n_recent"])
 
+col1, col2, col3 = st.columns(3)
+col1.metric("Contributors (P99)", f"{n_top}")
+col2.metric("Super core", f"{n_super_core}")
+col3.metric("Active in last 6 months", f"{n_recent}")
 
+st.markdown(f"""
+By focusing on the contributors of the platform’s maturity phase (2007–2015) — still publishing after 
+**{cutoff[:4]}**, active at least **{min_active_months} months** between 2008 and 2014, above the 
+**P{percentile_min_recipes*100:.0f}** of recipes and with at least **{min_late_share:.0%}** of their recipes after {cutoff[:4]}:
+- among the **{n_top} contributors in the 99th percentile (P99)**, **{n_super_core} major contributors** were identified, 
+  accounting for **{selected['recipe_share']*100:.1f}%** of all recipes;  
+- applying an additional criterion of **recent activity (within the last six months)** 
+  further narrows this group down to **{n_recent} key contributors**.
 
+These {n_recent} contributors form the **strategic core to retain, support, and guide** 
+in promoting **public health objectives** and improving the **nutritional quality** of the recipes shared on the platform.
+""")
@@ -1,17 +1,23 @@
-from collections import Counter
-
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
 
 from utils.sidebar import kaggle_link
-from utils.data_loader import load_recipes
+from utils.charts import scatter_figure
+from utils.data_loader import (
+    cache_shared,
+    load_list_column,
+    load_nutrition_clusters,
+    load_recipes,
+    load_trim_mask,
+    nutrition_categories,
+)
+from utils.distribution import DistributionIndex
+from utils.executor import background, wait_for
 from utils.logger import logger
 from utils.navbar import hide_page_navbar
 from utils.navbar import nav
+from utils.store import table_version
 
 from assets import CAMENBEAR
 
@@ -33,36 +39,35 @@ st.sidebar.image(CAMENBEAR, width="stretch")
 logger.info("Starting healthiness analysis page...")
 
 
-@st.cache_data
+# Nutrition and size columns: ids and dates are not trimmed
+TRIM_COLUMNS = nutrition_categories + ["minutes", "n_steps", "n_ingredients"]
+
+
+@cache_shared
 def preprocess_data() -> pd.DataFrame:
     """Load and preprocess recipe data with outlier removal."""
     logger.info("Preprocessing nutritional data...")
-    df_recipes = load_recipes()
-    df_recipes["Calories"] = (df_recipes["Calories"] / 2000) * 100
-
-    numeric_cols = df_recipes.select_dtypes(include=["number"]).columns
-    for col in numeric_cols:
-        lower = df_recipes[col].quantile(0.01)
-        upper = df_recipes[col].quantile(0.99)
-        df_recipes = df_recipes[
-            (df_recipes[col] >= lower) & (df_recipes[col] <= upper)
-        ]
-    return df_recipes
+    df_recipes = load_recipes(TRIM_COLUMNS)
+    # Single combined mask over the 1st-99th percentile bounds of every column
+    df_recipes = df_recipes[load_trim_mask("recipes", TRIM_COLUMNS)]
+    return df_recipes.assign(Calories=df_recipes["Calories"] / 2000 * 100)
 
 
 df_recipes = preprocess_data()
-THRESHOLD = 33
+THRESHOLD = st.sidebar.slider("Threshold (% of daily value)", 1, 100, 33)
+LOW = f"≤ {THRESHOLD}% of PDV"
+HIGH = f"> {THRESHOLD}% of PDV"
 
 st.title("Healthyness")
 
 st.header("A. Are the meals proposed by the platform healthy?")
 
-st.markdown("""
+st.markdown(f"""
 We visualize the distribution of each nutritional variable to identify how many recipes
-fall above or below 33% of the recommended daily intake, assuming three meals per day.
+fall above or below {THRESHOLD}% of the recommended daily intake (33% assuming three meals per day).
 
-**Color coding:** Dark blue indicates recipes providing less than 33% of the daily value,
-while light blue represents those providing more than 33%.
+**Color coding:** Dark blue indicates recipes providing less than {THRESHOLD}% of the daily value,
+while light blue represents those providing more than {THRESHOLD}%.
 
 **Data processing:** The original data was converted into seven numerical features and
 outliers (below 1st percentile and above 99th percentile) were removed.
@@ -78,16 +83,27 @@ NUTRIENTS = [
     "Carbohydrates",
 ]
 
-summary = {
-    n: {
-        "≤ 33% of PDV": (df_recipes[n] <= THRESHOLD).sum(),
-        "> 33% of PDV": (df_recipes[n] > THRESHOLD).sum(),
-    }
-    for n in NUTRIENTS
-}
+
+
+def mostly_above(summary: pd.DataFrame) -> list[str]:
+    """Nutrients for which most recipes of ``summary`` exceed the threshold."""
+    return summary.index[summary[HIGH] > summary[LOW]].tolist()
+
+
+@st.cache_resource
+def build_nutrient_index(version: str, by_cluster: bool = False) -> DistributionIndex:
+    """Sorted nutrient values of the preprocessed recipes (per cluster if
+    ``by_cluster``), so that moving the threshold is a binary search."""
+    labels = run_clustering().result()[0]["cluster"] if by_cluster else None
+    return DistributionIndex(df_recipes[NUTRIENTS], labels)
+
 
 st.markdown("### A.1 Distribution of recipes by nutrient category")
-df_summary = pd.DataFrame(summary).T
+df_summary = (
+    build_nutrient_index(table_version("recipes"))
+    .split(THRESHOLD)
+    .rename(columns={"at_most": LOW, "above": HIGH})
+)
 
 df_melt = df_summary.reset_index().melt(
     id_vars="index",
@@ -105,10 +121,10 @@ fig = px.bar(
     y="Proportion",
     color="Category",
     color_discrete_map={
-        "≤ 33% of PDV": "#0B4F6C",
-        "> 33% of PDV": "#A7C7E7",
+        LOW: "#0B4F6C",
+        HIGH: "#A7C7E7",
     },
-    title="Share of recipes above and below 33% of daily value per nutrient",
+    title=f"Share of recipes above and below {THRESHOLD}% of daily value per nutrient",
     labels={"index": "Nutrient", "Proportion": "Share of recipes (%)"},
 )
 
@@ -122,8 +138,17 @@ fig.add_hline(
 
 st.plotly_chart(fig, use_container_width=True)
 
-st.markdown("""
-**Observation:** Most recipes appear healthy with nutrient intakes under 33%.
+above_all = mostly_above(df_summary)
+if above_all:
+    observation = (
+        f"At {THRESHOLD}%, most recipes stay under the threshold for {len(NUTRIENTS) - len(above_all)} "
+        f"of {len(NUTRIENTS)} nutrients; most exceed it in {', '.join(above_all)}."
+    )
+else:
+    observation = f"At {THRESHOLD}%, most recipes appear healthy with nutrient intakes under the threshold."
+
+st.markdown(f"""
+**Observation:** {observation}
 
 **Problem:** The data includes beverages and snacks that are typically sweet or salty,
 biasing the healthiness analysis. We need to focus on main dishes.
@@ -134,9 +159,15 @@ composition, then visualize clusters using PCA for dimensionality reduction.
 
 st.markdown("<br>", unsafe_allow_html=True)
 
-@st.cache_data
+@background(tables=["recipes"])
 def run_clustering():
-    """Perform k-means clustering on nutritional features and reduce to 2D with PCA."""
+    """Nutrition clusters and 2D PCA projection of the recipes kept by preprocess_data.
+
+    The k-means and PCA models are fitted and applied by init_data, see
+    ``utils/nutrition_clusters.py``; the returned frame is new, the cached
+    ``df_recipes`` is left untouched. Runs in the background pool: the
+    result is shared by every session and must not be modified.
+    """
     features = [
         "Calories",
         "Total fat",
@@ -147,114 +178,48 @@ def run_clustering():
         "Carbohydrates",
     ]
 
-    def clean_tags(tag_str):
-        """Extract and filter relevant tags from tag string."""
-        if pd.isna(tag_str):
-            return []
-        tags = (tag_str.strip("[]")
-                .replace("'", "")
-                .replace('"', "")
-                .replace(' ', '')
-                .split(','))
-        ignore = {
-            "equipment", "30-minutes-or-less", "15-minutes-or-less",
-            "60-minutes-or-less", "3-steps-or-less", "4-hours-or-less",
-            "cuisine", "occasion", "low-in-something", "dietary",
-            "time-to-make", "course", "main-ingredient", "preparation",
-            "easy", "number-of-servings",
-        }
-        return tuple([t for t in tags if t not in ignore])
-
-    df_recipes["clean_tags"] = df_recipes["tags"].apply(clean_tags)
-    X = df_recipes[features].fillna(0)
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-
-    kmeans = KMeans(n_clusters=5, random_state=42)
-    df_recipes["cluster"] = kmeans.fit_predict(X_scaled)
-
-    cluster_profiles = df_recipes.groupby("cluster")[features].mean().round(1)
-    pca = PCA(n_components=2)
-    X_pca = pca.fit_transform(X_scaled)
-    df_recipes["PC1"] = X_pca[:, 0]
-    df_recipes["PC2"] = X_pca[:, 1]
-
-    return df_recipes, cluster_profiles
-
-
-@st.cache_data
-def compute_tag_summary(df, top_n=3):
-    """Compute most common tags and centroid coordinates for each cluster."""
-    summaries = []
-    for cluster_id, group in df.groupby("cluster"):
-        tags_flat = [t for tags in group["clean_tags"].dropna() for t in tags]
-        common_tags = [t for t, _ in Counter(tags_flat).most_common(top_n)]
-        summaries.append({
-            "cluster": cluster_id,
-            "tags": ", ".join(common_tags),
-            "x": group["PC1"].mean(),
-            "y": group["PC2"].mean(),
-        })
-    return pd.DataFrame(summaries)
+    # Labels and projections are aligned with the store rows: pick the rows
+    # kept by preprocess_data
+    clusters = load_nutrition_clusters().take(df_recipes.index)
+    clusters.index = df_recipes.index
 
+    cluster_profiles = df_recipes[features].groupby(clusters["cluster"]).mean().round(1)
 
-df_recipes = preprocess_data()
-df_recipes, cluster_profiles = run_clustering()
-
-tag_summary = compute_tag_summary(df_recipes, top_n=3)
-fig = px.scatter(
-    df_recipes,
-    x="PC1",
-    y="PC2",
-    color=df_recipes["cluster"].astype(str),
-    opacity=0.6,
-    title="Clustering of recipes based on nutritional profiles",
-    color_discrete_sequence=px.colors.qualitative.Plotly
-)
-
-offsets = [(40, -40), (-60, 40), (60, -20), (80, 50), (60, -20)]
-for i, row in enumerate(tag_summary.iterrows()):
-    _, r = row
-    ax_offset, ay_offset = offsets[i % len(offsets)]
-    fig.add_annotation(
-        x=r["x"],
-        y=r["y"],
-        text=r["tags"],
-        showarrow=True,
-        arrowhead=2,
-        ax=ax_offset,
-        ay=ay_offset,
-        font=dict(color="black", size=13, family="Arial"),
-        bgcolor="rgba(255,255,255,0.9)",
-        bordercolor="rgba(0,0,0,0.3)",
-        borderwidth=0.5,
-        borderpad=4
-    )
+    return clusters, cluster_profiles
 
-fig.update_traces(marker=dict(size=5))
-fig.update_layout(
-    width=700,
-    height=600,
-    margin=dict(l=80, r=80, t=80, b=80),
-    title_font=dict(size=22)
-)
 
-st.plotly_chart(fig, use_container_width=False)
+IGNORED_TAGS = {
+    "equipment", "30-minutes-or-less", "15-minutes-or-less",
+    "60-minutes-or-less", "3-steps-or-less", "4-hours-or-less",
+    "cuisine", "occasion", "low-in-something", "dietary",
+    "time-to-make", "course", "main-ingredient", "preparation",
+    "easy", "number-of-servings",
+}
 
-st.markdown("### A.2 Cluster summary")
 
-st.markdown("""
-Each cluster groups recipes with similar nutritional patterns. By analyzing their most
-frequent tags and nutritional values, we categorize them as main meals, desserts, drinks,
-snacks, or sauces. This helps filter out non-main dishes for more relevant analysis.
-""")
+@cache_shared
+def compute_tag_summary(df, top_n=3):
+    """Compute most common tags and centroid coordinates for each cluster."""
+    # One sparse product over the encoded tags, indexed by store row
+    top_tags = load_list_column("tags").top_tokens(df["cluster"], top_n, exclude=IGNORED_TAGS)
+    centroids = df.groupby("cluster")[["PC1", "PC2"]].mean()
+    return pd.DataFrame({
+        "cluster": centroids.index,
+        "tags": top_tags.reindex(centroids.index).map(", ".join),
+        "x": centroids["PC1"],
+        "y": centroids["PC2"],
+    }).reset_index(drop=True)
 
-cluster_summary = cluster_profiles.copy()
-cluster_summary["top_tags"] = tag_summary.set_index("cluster")["tags"]
-cluster_summary = cluster_summary.reset_index()
-cluster_palette = px.colors.qualitative.Plotly
 
-palette_dict = {cluster: cluster_palette[i] for i, cluster in enumerate(df_recipes["cluster"].unique())}
+df_recipes = preprocess_data()
+# The clusters are computed by init_data, never by the app
+try:
+    load_nutrition_clusters()
+except FileNotFoundError as error:
+    st.error(f"Part B needs the nutrition clusters: {error}.")
+    clusters_ready = False
+else:
+    clusters_ready = True
 
 
 def categorize_cluster(tags):
@@ -280,83 +245,172 @@ def cluster_color(cluster_id):
     return f"background-color: {palette_dict[cluster_id]}; color: white;"
 
 
-cluster_summary["category"] = cluster_summary["top_tags"].apply(categorize_cluster)
-cols = ["cluster", "category", "top_tags"] + [
-    c for c in cluster_profiles.columns if c != "cluster"
-]
+# Part A is already on the page while the clusters are read; what depends
+# on them is drawn once they are, the text around it right away
+results = wait_for(run_clustering(), "Reading nutrition clusters...") if clusters_ready else None
+if results is not None:
+    clusters, cluster_profiles = results
 
-st.dataframe(
-    cluster_summary[cols].style.apply(
-        lambda s: [cluster_color(v) if s.name == "cluster" else "" for v in s],
-        axis=0
+    tag_summary = compute_tag_summary(clusters, top_n=3)
+    # One color per cluster id, shared by the scatter and the summary table
+    cluster_palette = px.colors.qualitative.Plotly
+    palette_dict = {
+        cluster: cluster_palette[i % len(cluster_palette)]
+        for i, cluster in enumerate(sorted(clusters["cluster"].unique()))
+    }
+    # WebGL, and a stratified sample per cluster beyond MAX_POINTS recipes
+    fig = scatter_figure(
+        clusters,
+        "PC1",
+        "PC2",
+        color="cluster",
+        colors=palette_dict,
+        title="Clustering of recipes based on nutritional profiles",
+        opacity=0.6,
+        size=5,
     )
-)
 
-main_dish_cols = [
-    "id", "Calories", "Total fat", "Sugar", "Sodium",
-    "Protein", "Saturated fat", "Carbohydrates"
-]
-df_main_dishes = df_recipes[
-    (df_recipes["cluster"] == 1) | (df_recipes["cluster"] == 3)
-][main_dish_cols]
-
-summary = {
-    n: {
-        "≤ 33% of PDV": (df_main_dishes[n] <= THRESHOLD).sum(),
-        "> 33% of PDV": (df_main_dishes[n] > THRESHOLD).sum(),
-    }
-    for n in NUTRIENTS
-}
+    offsets = [(40, -40), (-60, 40), (60, -20), (80, 50), (60, -20)]
+    for i, row in enumerate(tag_summary.iterrows()):
+        _, r = row
+        ax_offset, ay_offset = offsets[i % len(offsets)]
+        fig.add_annotation(
+            x=r["x"],
+            y=r["y"],
+            text=r["tags"],
+            showarrow=True,
+            arrowhead=2,
+            ax=ax_offset,
+            ay=ay_offset,
+            font=dict(color="black", size=13, family="Arial"),
+            bgcolor="rgba(255,255,255,0.9)",
+            bordercolor="rgba(0,0,0,0.3)",
+            borderwidth=0.5,
+            borderpad=4
+        )
+
+    fig.update_layout(
+        width=700,
+        height=600,
+        margin=dict(l=80, r=80, t=80, b=80),
+        title_font=dict(size=22)
+    )
 
-df_summary = pd.DataFrame(summary).T
+    st.plotly_chart(fig, use_container_width=False)
 
-df_melt = df_summary.reset_index().melt(
-    id_vars="index",
-    var_name="Category",
-    value_name="Count"
-)
+st.markdown("### A.2 Cluster summary")
 
-df_melt["Proportion"] = df_melt.groupby("index")["Count"].transform(
-    lambda x: x / x.sum() * 100
-)
+st.markdown("""
+Each cluster groups recipes with similar nutritional patterns. By analyzing their most
+frequent tags and nutritional values, we categorize them as main meals, desserts, drinks,
+snacks, or sauces. This helps filter out non-main dishes for more relevant analysis.
+""")
 
-fig = px.bar(
-    df_melt,
-    x="index",
-    y="Proportion",
-    color="Category",
-    color_discrete_map={
-        "≤ 33% of PDV": "#0B4F6C",
-        "> 33% of PDV": "#A7C7E7",
-    },
-    title="Share of main dishes above and below 33% of daily value per nutrient",
-    labels={"index": "Nutrient", "Proportion": "Share of recipes (%)"},
-)
+if results is not None:
+    cluster_summary = cluster_profiles.copy()
+    cluster_summary["top_tags"] = tag_summary.set_index("cluster")["tags"]
+    cluster_summary = cluster_summary.reset_index()
+    cluster_summary["category"] = cluster_summary["top_tags"].apply(categorize_cluster)
+    cols = ["cluster", "category", "top_tags"] + [
+        c for c in cluster_profiles.columns if c != "cluster"
+    ]
 
-fig.add_hline(
-    y=50,
-    line_dash="solid",
-    line_color="red",
-    annotation_text="50%",
-    annotation_position="top left"
-)
+    st.dataframe(
+        cluster_summary[cols].style.apply(
+            lambda s: [cluster_color(v) if s.name == "cluster" else "" for v in s],
+            axis=0
+        )
+    )
+
+    # Cluster ids follow increasing calories, so the original hard-coded ids
+    # {1, 3} no longer apply: main dishes are the clusters whose top tags read
+    # as main meals
+    main_clusters = cluster_summary.loc[cluster_summary["category"] == "Main meal / Entrée", "cluster"]
+    if main_clusters.empty:
+        # Deterministic fallback: the two clusters richest in protein and fat
+        main_clusters = (
+            cluster_profiles[["Protein", "Total fat"]].sum(axis=1).nlargest(2).index.to_series()
+        )
+        st.warning(
+            "No cluster's top tags identify main meals; the main dishes below are approximated "
+            f"by the clusters richest in protein and fat ({', '.join(map(str, main_clusters))})."
+        )
+
+    df_summary = (
+        build_nutrient_index(table_version("recipes"), by_cluster=True)
+        .split(THRESHOLD, labels=main_clusters)
+        .rename(columns={"at_most": LOW, "above": HIGH})
+    )
+
+    df_melt = df_summary.reset_index().melt(
+        id_vars="index",
+        var_name="Category",
+        value_name="Count"
+    )
+
+    df_melt["Proportion"] = df_melt.groupby("index")["Count"].transform(
+        lambda x: x / x.sum() * 100
+    )
 
-st.plotly_chart(fig)
+    fig = px.bar(
+        df_melt,
+        x="index",
+        y="Proportion",
+        color="Category",
+        color_discrete_map={
+            LOW: "#0B4F6C",
+            HIGH: "#A7C7E7",
+        },
+        title=f"Share of main dishes above and below {THRESHOLD}% of daily value per nutrient",
+        labels={"index": "Nutrient", "Proportion": "Share of recipes (%)"},
+    )
+
+    fig.add_hline(
+        y=50,
+        line_dash="solid",
+        line_color="red",
+        annotation_text="50%",
+        annotation_position="top left"
+    )
+
+    st.plotly_chart(fig)
 
 st.markdown("## B. Conclusion")
 
-st.markdown("""
-The initial analysis suggested that most recipes on the platform are healthy, with all
-nutrients below the 33% threshold. However, after filtering for main dishes using
-clustering, the results reveal a different picture:
+if results is not None:
+    # The narrative follows the threshold of the sidebar (33% by default)
+    above_main = mostly_above(df_summary)
+    if above_main:
+        nutrients = ", ".join(above_main)
+        if set(above_main) - set(above_all):
+            contrast = """However, after
+filtering for main dishes using clustering, the results reveal a different picture:"""
+            skew = """- The initial dataset was skewed by beverages, snacks, and desserts that are typically
+  lower in these nutrients"""
+        else:
+            contrast = "Filtering for main dishes using clustering confirms it:"
+            skew = ""
+        findings = f"""
+The initial analysis showed that {observation[0].lower() + observation[1:]} {contrast}
 
 **Key findings:**
-- **Total fat, Protein, and Saturated fat** exceed 33% PDV in most main dishes
-- This indicates that main meals on the platform tend to be rich in fats and proteins
-- The initial dataset was skewed by beverages, snacks, and desserts that are typically
-  lower in these nutrients
+- **{nutrients}** {'exceeds' if len(above_main) == 1 else 'exceed'} {THRESHOLD}% PDV in most main dishes
+- This indicates that main meals on the platform tend to be rich in these nutrients
+{skew}
 
 **Interpretation:** While the platform offers diverse recipe types, main dishes tend to
-provide substantial portions of daily fat and protein intake. Users should be mindful of
+provide substantial portions of the daily intake of {nutrients}. Users should be mindful of
 these nutritional profiles when planning balanced meals.
-""")
+"""
+    elif above_all:
+        findings = f"""
+At {THRESHOLD}% PDV, main dishes stay under the threshold for every nutrient in most
+cases, although most recipes of the whole dataset exceed it in {', '.join(above_all)}.
+"""
+    else:
+        findings = f"""
+At {THRESHOLD}% PDV, main dishes stay under the threshold for every nutrient in most
+cases: filtering for main dishes does not change the picture of the initial analysis.
+"""
+
+    st.markdown(findings)
@@ -4,7 +4,17 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import plotly.express as px
 import plotly.graph_objects as go
-from utils.data_loader import load_recipes, load_interactions, nutrition_categories
+from utils.aggregates import source_versions
+from utils.charts import MAX_POINTS, histogram_figure, lorenz_figure, scatter_trace, stratified_sample
+from utils.data_loader import (
+    load_aggregate,
+    load_concentration,
+    load_recipes,
+    nutrition_categories,
+    scan_interactions,
+)
+from utils.graph import Graph
+from utils.memory_cache import memory_cache
 from utils.sidebar import kaggle_link
 from assets import CAMENBEAR
 
@@ -27,26 +37,37 @@ st.sidebar.image(CAMENBEAR, width="stretch")
 
 
 # To draw histograms
-def histogram(dataset, selected_column, title, bin_nb):
+def histogram(dataset, selected_column, title, bin_nb, counts=None):
+    """Histogram binned server-side: only the bars are sent to the browser.
+
+    With ``counts``, ``dataset`` is pre-aggregated (one row per distinct
+    value of ``selected_column`` and its number of occurrences).
+    """
     # Histogram
     st.subheader("Histogram")
-    # fig, ax = plt.subplots(figsize=(3, 2))
-    # ax.hist(dataset[selected_column].dropna(), align='mid', bins=bin_nb, color='teal') #, edgecolor='black')
-    # ax.set_title(title)
-    # ax.set_xlabel(selected_column)
-    # ax.set_ylabel("Frequence")
-    fig = px.histogram(
-        dataset,
-        x=selected_column,
-        nbins=bin_nb,
-        labels={'x': selected_column, 'y': "Frequence"},
-        title=title)
+    fig = histogram_figure(
+        dataset[selected_column],
+        bin_nb,
+        weights=None if counts is None else dataset[counts],
+        title=title,
+        x_title=selected_column)
 
     st.plotly_chart(fig)
 
 # Load data files
-recipes = load_recipes()
-interaction_data = load_interactions()
+recipes = load_recipes(["id"])
+# Only displayed as a preview: the first rows are read, not the whole table
+interaction_data = scan_interactions()
+# Group-bys materialised at ingest time (see utils/aggregates.py)
+evaluated_recipes = load_aggregate("recipe_evaluations")
+recipes_evaluation_merged = load_aggregate("evaluated_recipes_nutrition")
+
+# Derived values are kept in the session and recomputed only downstream of
+# what changed: a new dataset or a widget (see utils/graph.py)
+graph = Graph("popular_recipes")
+graph.input("evaluated_recipes", evaluated_recipes, key=source_versions("recipe_evaluations"))
+graph.input("recipes_evaluation_merged", recipes_evaluation_merged,
+            key=source_versions("evaluated_recipes_nutrition"))
 
 st.title("Popular Recipes Analysis")
 
@@ -71,7 +92,7 @@ st.dataframe(interaction_data.head())
 # Determination of the number of evaluated recipes# Change data extension to catch csv files and not pickle ones
 
 # copy from utils file and change pickle to csv to keep the load_data() function
-nb_recette_notees = interaction_data["recipe_id"].nunique()
+nb_recette_notees = len(evaluated_recipes)
 nb_recette_recipe = recipes["id"].count()
 st.markdown(f"""The number of evaluated recipes : {nb_recette_notees} is identical to the number of recipes in the recipes dataset : {nb_recette_recipe}.
         With others words, all recipes are evaluated at least one time.
@@ -81,7 +102,7 @@ st.markdown(f"""The number of evaluated recipes : {nb_recette_notees} is identic
 st.subheader("A.2 Rating of recipes")
 st.write("With each evaluation, a rating from 1 to 5 is done. We built an histogram of the ratings to determine their distribution.")
 # Histogram of recipe ratings
-histogram(interaction_data, "rating", "Number per rating", 5)
+histogram(load_aggregate("rating_counts"), "rating", "Number per rating", 5, counts="count")
 # comment of recipe ratings
 st.write("We can see that the majority of the ratings are at level 5. This criterion is not a discriminating criterion for determining the popularity of a recipe.")
 
@@ -89,10 +110,6 @@ st.write("We can see that the majority of the ratings are at level 5. This crite
 st.subheader("A.3 Number of evaluation per recipe")
 st.write("In the next, we will determine the popularity by the number of evaluations per recipe."
          "\n We will focus on the recipes that received more than 10 evaluations.")
-# Built of a dataset with the number of evalution by recipe
-evaluated_recipes = interaction_data["recipe_id"].value_counts().reset_index()
-evaluated_recipes.columns = ["recipe_id", "n_evaluated"]
-
 evaluated_recipes_sup_10 = evaluated_recipes[evaluated_recipes["n_evaluated"] > 10]
 histogram(evaluated_recipes_sup_10, "n_evaluated", "Distribution for the recipes with more than 10 evaluations", 30)
 st.write(f"The median of the number of evaluations is at {evaluated_recipes_sup_10["n_evaluated"].median()}"
@@ -100,47 +117,81 @@ st.write(f"The median of the number of evaluations is at {evaluated_recipes_sup_
 
 st.subheader("A.4 Number of evaluation per recipe")
 nb_most_popular = 200
-popular_recipes = evaluated_recipes.nlargest(nb_most_popular, "n_evaluated")
-histogram(popular_recipes, "n_evaluated", f"Distribution of evaluations for the {nb_most_popular} most popular recipes", 30)
+
+
+@graph.node
+def popular_recipes(evaluated_recipes):
+    return evaluated_recipes.nlargest(nb_most_popular, "n_evaluated")
+
+
+histogram(popular_recipes(), "n_evaluated", f"Distribution of evaluations for the {nb_most_popular} most popular recipes", 30)
 st.write(f"For this study, we selected {nb_most_popular} the number of the most popular recipes."
-         f" The number of evaluations for the {nb_most_popular}th most popular recipe is {popular_recipes["n_evaluated"].min()} evaluations.")
+         f" The number of evaluations for the {nb_most_popular}th most popular recipe is {popular_recipes()["n_evaluated"].min()} evaluations.")
+
+st.subheader("A.5 Concentration of evaluations")
+# Both curves come from sorted-once aggregates (see utils/concentration.py)
+per_recipe = load_concentration("recipe_evaluations", "n_evaluated")
+per_user = load_concentration("user_reviews", "n_reviews")
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Evaluations of the top 10% recipes", f"{per_recipe.top_share(0.10)*100:.1f}%")
+col2.metric("Gini (evaluations per recipe)", f"{per_recipe.gini():.2f}")
+col3.metric("Reviews of the top 10% users", f"{per_user.top_share(0.10)*100:.1f}%")
+col4.metric("Gini (reviews per user)", f"{per_user.gini():.2f}")
+st.plotly_chart(lorenz_figure(
+    {"Evaluations per recipe": per_recipe, "Reviews per user": per_user},
+    title="Lorenz curves of the evaluations",
+    x_title="Cumulative share of recipes / users",
+    y_title="Cumulative share of evaluations"))
 
 st.header("B. Relationship between popularity and nutritional values")
 st.write("Select the nutritional parameter on the left"
          "\nMove cursors to zoom")
 
-popular_recipes_merged = pd.merge(recipes, popular_recipes, left_on="id", right_on="recipe_id")
-
-# Merge of the both full dataset
-recipes_evaluation_merged = pd.merge(recipes, evaluated_recipes, left_on="id", right_on="recipe_id")
-# Dataset with only the number of evaluations higher than 10
-evaluated_recipes_sup_10 = recipes_evaluation_merged[recipes_evaluation_merged["n_evaluated"] > 10]
-# Cleaning recipes with a number of calories higher than 10000
-recipes_evaluation_merged_cleaned = evaluated_recipes_sup_10.drop(evaluated_recipes_sup_10[evaluated_recipes_sup_10["Calories"] > 10000].index)
-# List of nutritional parameters
-# Define limits for the x cursors
-min_val = int(recipes_evaluation_merged_cleaned["n_evaluated"].min())
-max_val = int(recipes_evaluation_merged_cleaned["n_evaluated"].max())
 dot_size = 10
-col1, col2 = st.columns([1, 5])
-with col1:
-    selected_column = st.radio("Choice one nutrition parameter", nutrition_categories)
-    # Cursors for x axis
-    selected_x = st.slider("Number of evaluations :", min_value=min_val, max_value=max_val, value=(min_val, max_val))
-    
-with col2:
+
+
+@graph.node
+def popular_recipes_merged(recipes_evaluation_merged, popular_recipes):
+    return recipes_evaluation_merged[recipes_evaluation_merged["recipe_id"].isin(popular_recipes["recipe_id"])]
+
+
+@graph.node
+def recipes_evaluation_merged_cleaned(recipes_evaluation_merged):
+    # Dataset with only the number of evaluations higher than 10
+    evaluated_recipes_sup_10 = recipes_evaluation_merged[recipes_evaluation_merged["n_evaluated"] > 10]
+    # Cleaning recipes with a number of calories higher than 10000
+    return evaluated_recipes_sup_10[~(evaluated_recipes_sup_10["Calories"] > 10000)]
+
+
+@graph.node
+def evaluations_range(recipes_evaluation_merged_cleaned):
+    # Define limits for the x cursors
+    return (int(recipes_evaluation_merged_cleaned["n_evaluated"].min()),
+            int(recipes_evaluation_merged_cleaned["n_evaluated"].max()))
+
+
+@graph.node
+def column_max(recipes_evaluation_merged_cleaned, selected_column):
     # Define limits for the y cursor
-    max_val = int(recipes_evaluation_merged_cleaned[selected_column].max())
-    # Cursor for y axis
-    y_max_value = st.slider(selected_column, 0, max_val, value=max_val)
+    return int(recipes_evaluation_merged_cleaned[selected_column].max())
 
-    # Plot nutritional parameter versus nb of evaluations
+
+@memory_cache(tables=[])
+def scatter_points(df, column):
+    """Sampled ``(n_evaluated, column)`` points, kept per column in the memory cache."""
+    rows = stratified_sample(df["n_evaluated"], df[column], MAX_POINTS)
+    return df["n_evaluated"].to_numpy()[rows], df[column].to_numpy()[rows]
+
+
+@graph.node
+def evaluations_figure(recipes_evaluation_merged_cleaned, popular_recipes_merged, selected_column):
+    """Nutritional parameter versus number of evaluations, without the zoom."""
     fig5 = go.Figure()
-    # Plot all recipes evaluations
-    fig5.add_trace(go.Scatter(
-        x=recipes_evaluation_merged_cleaned["n_evaluated"],
-        y=recipes_evaluation_merged_cleaned[selected_column],
-        mode='markers',
+    # Plot all recipes evaluations (WebGL, sampled beyond MAX_POINTS recipes)
+    x, y = scatter_points(recipes_evaluation_merged_cleaned, selected_column)
+    fig5.add_trace(scatter_trace(
+        x=x,
+        y=y,
         marker=dict(color='orange', size=dot_size, opacity=0.3),
         name=selected_column
     ))
@@ -157,13 +208,39 @@ with col2:
         title=f"Relationship between number of evaluations and {selected_column} for the all recipes",
         xaxis_title="Number of evaluations",
         yaxis_title=selected_column,
-        xaxis=dict(range=selected_x, showgrid=True),
-        yaxis=dict(range=[0, y_max_value], showgrid=True),
+        xaxis=dict(showgrid=True),
+        yaxis=dict(showgrid=True),
         legend_title="Legend"
     )
-    st.plotly_chart(fig5)    
-    
-    
+    return fig5
+
+
+@st.fragment
+def relationship_section():
+    """Widgets and chart of part B: moving a cursor reruns only this function."""
+    col1, col2 = st.columns([1, 5])
+    with col1:
+        selected_column = graph.input(
+            "selected_column", st.radio("Choice one nutrition parameter", nutrition_categories))
+        # Cursors for x axis
+        min_val, max_val = evaluations_range()
+        selected_x = st.slider("Number of evaluations :", min_value=min_val, max_value=max_val, value=(min_val, max_val))
+
+    with col2:
+        # Cursor for y axis
+        max_val = column_max()
+        y_max_value = st.slider(selected_column, 0, max_val, value=max_val)
+
+        # Cursors only zoom: the figure is built once per parameter, and the
+        # zoom goes to a copy, so the memoised node is never modified
+        fig5 = go.Figure(evaluations_figure())
+        fig5.update_layout(xaxis_range=selected_x, yaxis_range=[0, y_max_value])
+        st.plotly_chart(fig5)
+
+
+relationship_section()
+
+
 st.header("C. Conclusion")
 st.write("In conclusion, all the most popular recipes have a good nutritional quality."
          "\nIt seems that the number of evaluations can be a parameter to find a good recipe.")
@@ -3,7 +3,9 @@ import calendar
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
-from utils.data_loader import load_recipes
+from utils.charts import histogram_bins, histogram_trace
+from utils.data_loader import load_submissions_cube
+from utils.memory_cache import memory_cache
 from utils.sidebar import kaggle_link
 from utils.logger import logger
 from assets import EATING_AT_RESTAURANT, JUNK_FOOD, FOOD_DELIVERY, CAMENBEAR
@@ -28,22 +30,9 @@ st.sidebar.image(CAMENBEAR, width="stretch")
 # =========================================================================
 # Retrieve and prepare data
 # =========================================================================
-df_recipes = load_recipes()
-
-# Retrieve targeted feature
-feat_name = 'submitted'
-df = df_recipes[[feat_name]]
-df_dates = df.copy()
-
-# Converting from strings to datetime format
-df_dates["date"] = pd.to_datetime(df_dates[feat_name], errors="coerce")
-df_dates = df_dates.dropna(subset=["date"])
-
-df_dates["year"] = df_dates["date"].dt.year
-years = df_dates["year"]
-
-# Remove empty data
-df_dates = df_dates.dropna()
+# Dense year × month × weekday counts of submitted recipes, built once from
+# the aggregates materialised at ingest time (see utils/aggregates.py)
+years, cube = load_submissions_cube()
 
 
 # =========================================================================
@@ -156,15 +145,11 @@ We got access to data of puslished recipes bethween 1999 and 2018. When we took
 # Histogram | Years (Plotly version)
 # ----------------------------------------
 
-# Compute bins so each bin belongs to a year
-bins = list(range(int(years.min()), int(years.max()) + 2))
-
-# Build the histogram
+# One bar per year, binned from the precomputed yearly counts
 fig_year = go.Figure(
     data=[
-        go.Histogram(
-            x=years,
-            xbins=dict(start=bins[0], end=bins[-1], size=1),
+        histogram_trace(
+            *histogram_bins(years, len(years), weights=cube.sum(axis=(1, 2))),
             marker=dict(
                 color="paleturquoise",
                 line=dict(color="black", width=1)
@@ -232,9 +217,8 @@ st.text(" ")
 # Interactive interface
 # =========================================================================
 
-# --- Inputs & setup (df_dates assumed available) ---
-all_years = sorted(df_dates["date"].dt.year.unique())
-min_y, max_y = int(min(all_years)), int(max(all_years))
+# --- Inputs & setup ---
+min_y, max_y = int(years[0]), int(years[-1])
 
 col1, col2 = st.columns([1, 2])
 with col1:
@@ -264,75 +248,67 @@ tick_step = st.selectbox(
     help="Select the amount of months between each label in the horizontal axis. This will help you to have a clean visual depending on the chosen year interval size (Data is not affected)."
 )
 
-# --- Filter once by year window ---
-mask_years = df_dates["date"].dt.year.between(year_start, year_end)
-df_window = df_dates.loc[mask_years, ["date"]].copy()
-
-# Build complete monthly index for the window (fill missing months with 0)
-full_month_index = pd.date_range(
-    f"{year_start}-01-01", f"{year_end}-12-01", freq="MS")
-
-# --- Plotly figure ---
-fig = go.Figure()
 
-for day in sel_days:
-    # Filter this weekday
-    m = df_window["date"].dt.day_name() == day
-    d = df_window.loc[m, "date"].copy()
+@memory_cache(tables=["recipes"])
+def weekday_figure(year_start: int, year_end: int, sel_days: tuple[str, ...], tick_step: int) -> go.Figure:
+    """Monthly submissions of each selected weekday, one figure per selection.
+
+    Kept in the size-bounded memory cache: going back to a previous
+    selection is a lookup, and old selections are evicted.
+    """
+    # --- Slice the year window once: (n_years, 12 months, 7 weekdays) ---
+    window = cube[year_start - min_y:year_end - min_y + 1]
+
+    # Build complete monthly index for the window (fill missing months with 0)
+    full_month_index = pd.date_range(
+        f"{year_start}-01-01", f"{year_end}-12-01", freq="MS")
+
+    # --- Plotly figure ---
+    fig = go.Figure()
+
+    for day in sel_days:
+        # Monthly counts for this weekday, already aligned on full_month_index
+        counts = window[:, :, list(calendar.day_name).index(day)].ravel()
+
+        fig.add_trace(
+            go.Scatter(
+                x=full_month_index,
+                y=counts,
+                mode="lines",
+                name=day,
+                line=dict(width=2),
+                hovertemplate="%{x|%b %Y}<br>%{y} occurrences<extra>" +
+                day + "</extra>",
+                line_shape="linear"  # <-- ensures straight line segments, no smoothing
+            )
+        )
 
-    # Monthly counts per weekday
-    mc = (
-        d.dt.to_period("M").value_counts().sort_index()
-        .rename_axis("ym").reset_index(name="count")
-    )
-    mc["date_label"] = mc["ym"].dt.to_timestamp()
-
-    # Keep only needed columns and reindex on full monthly index (fill gaps with 0)
-    mc = (
-        mc[["date_label", "count"]]
-        .set_index("date_label")
-        .reindex(full_month_index, fill_value=0)
-        .reset_index()
-        .rename(columns={"index": "date_label"})
+    # --- Layout & axes ---
+    fig.update_layout(
+        title=f"Weekday frequencies per month ({year_start}–{year_end})",
+        xaxis_title="Time (Year–Month)",
+        yaxis_title="Frequency",
+        legend_title="Weekday",
+        hovermode="x unified",
+        margin=dict(l=10, r=10, t=60, b=10)
     )
 
-    fig.add_trace(
-        go.Scatter(
-            x=mc["date_label"],
-            y=mc["count"],
-            mode="lines",
-            name=day,
-            line=dict(width=2),
-            hovertemplate="%{x|%b %Y}<br>%{y} occurrences<extra>" +
-            day + "</extra>",
-            line_shape="linear"  # <-- ensures straight line segments, no smoothing
-        )
+    # Monthly ticks every `tick_step` months with 'Mon YYYY' format
+    fig.update_xaxes(
+        dtick=f"M{tick_step}",
+        tickformat="%b %Y",
+        tickangle=45,
+        showgrid=True,
+        gridwidth=1
     )
+    fig.update_yaxes(showgrid=True, gridwidth=1, rangemode="tozero")
 
-# --- Layout & axes ---
-fig.update_layout(
-    title=f"Weekday frequencies per month ({year_start}–{year_end})",
-    xaxis_title="Time (Year–Month)",
-    yaxis_title="Frequency",
-    legend_title="Weekday",
-    hovermode="x unified",
-    margin=dict(l=10, r=10, t=60, b=10)
-)
-
-# Monthly ticks every `tick_step` months with 'Mon YYYY' format
-fig.update_xaxes(
-    dtick=f"M{tick_step}",
-    tickformat="%b %Y",
-    tickangle=45,
-    showgrid=True,
-    gridwidth=1
-)
-fig.update_yaxes(showgrid=True, gridwidth=1, rangemode="tozero")
+    # Optional tighter x-range for nice padding
+    fig.update_xaxes(range=[full_month_index.min(), full_month_index.max()])
+    return fig
 
-# Optional tighter x-range for nice padding
-fig.update_xaxes(range=[full_month_index.min(), full_month_index.max()])
 
-st.plotly_chart(fig, use_container_width=True)
+st.plotly_chart(weekday_figure(year_start, year_end, tuple(sel_days), tick_step), use_container_width=True)
 
 
 # =========================================================================
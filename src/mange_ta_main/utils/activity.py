@@ -0,0 +1,217 @@
+"""Sparse contributor × month activity matrix.
+
+Most contributors publish in a handful of months, so the dense
+``unstack(fill_value=0)`` matrix is almost all zeros. :class:`ActivityMatrix`
+keeps the counts in CSR form for the whole population and answers the
+per-contributor questions of the contributor page with vectorised
+operations on the CSR arrays.
+
+The KMeans fits of the activity trajectories for several numbers of
+clusters are independent, so they run concurrently in the shared
+background pool (see ``utils/executor.py``), and are kept in the disk
+cache across restarts.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.cluster import KMeans
+from sklearn.metrics import silhouette_score
+from sklearn.preprocessing import StandardScaler
+
+from utils.disk_cache import disk_cache
+from utils.executor import Job, run_in_background
+
+
+class ActivityMatrix:
+    """Recipes per contributor (rows) and month (columns), in CSR form.
+
+    Like the dense ``unstack`` it replaces, ``months`` holds only the months
+    in which at least one of the rows published: rolling windows run over
+    these columns, not over calendar months.
+    """
+
+    def __init__(self, counts: sparse.csr_array, contributors: pd.Index, months: pd.DatetimeIndex):
+        self.counts = counts
+        self.contributors = contributors
+        self.months = months
+
+    @classmethod
+    def from_monthly(cls, monthly: pd.DataFrame) -> "ActivityMatrix":
+        """Build from the long ``contributor_months`` aggregate."""
+        contributors, rows = np.unique(monthly["contributor_id"].to_numpy(), return_inverse=True)
+        months, cols = np.unique(monthly["month"].to_numpy().astype("datetime64[M]"), return_inverse=True)
+        months = pd.DatetimeIndex(months.astype("datetime64[ns]"))
+        counts = sparse.csr_array(
+            (monthly["n_recipes"].to_numpy(), (rows, cols)),
+            shape=(len(contributors), len(months)),
+        )
+        counts.sum_duplicates()
+        counts.sort_indices()
+        return cls(counts, pd.Index(contributors, name="contributor_id"), months)
+
+    def __len__(self) -> int:
+        return self.counts.shape[0]
+
+    def _col(self, date) -> int:
+        """Index of the first month column at or after ``date``."""
+        return int(self.months.searchsorted(pd.Timestamp(date)))
+
+    def _row_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self)), np.diff(self.counts.indptr))
+
+    def take(self, rows) -> "ActivityMatrix":
+        """Matrix of ``rows``, without the months none of them published in."""
+        rows = np.asarray(rows)
+        counts = self.counts[rows]
+        cols = np.unique(counts.indices)
+        counts = counts[:, cols]
+        counts.sort_indices()
+        return ActivityMatrix(counts, self.contributors[rows], self.months[cols])
+
+    def top(self, n: int) -> "ActivityMatrix":
+        """The ``n`` contributors with the most recipes (rows stay in id order)."""
+        return self.take(np.sort(np.argsort(-self.totals(), kind="stable")[:n]))
+
+    def totals(self) -> np.ndarray:
+        return np.asarray(self.counts.sum(axis=1)).ravel()
+
+    def window_sum(self, start=None, end=None) -> np.ndarray:
+        """Recipes per row between ``start`` and ``end`` (inclusive months)."""
+        lo = 0 if start is None else self._col(start)
+        hi = len(self.months) if end is None else int(self.months.searchsorted(pd.Timestamp(end), side="right"))
+        mask = (self.counts.indices >= lo) & (self.counts.indices < hi)
+        return np.bincount(self._row_ids()[mask], weights=self.counts.data[mask], minlength=len(self))
+
+    def active_months(self, start=None, end=None) -> np.ndarray:
+        """Number of months with at least one recipe between ``start`` and ``end``."""
+        lo = 0 if start is None else self._col(start)
+        hi = len(self.months) if end is None else int(self.months.searchsorted(pd.Timestamp(end), side="right"))
+        mask = (self.counts.indices >= lo) & (self.counts.indices < hi) & (self.counts.data > 0)
+        return np.bincount(self._row_ids()[mask], minlength=len(self))
+
+    def last_active(self) -> pd.DatetimeIndex:
+        """Last month with a recipe for each row (``NaT`` for empty rows)."""
+        indptr, indices = self.counts.indptr, self.counts.indices
+        nonempty = np.diff(indptr) > 0
+        # Column indices are sorted within each row of a canonical CSR array
+        last = np.full(len(self), -1)
+        last[nonempty] = indices[indptr[1:][nonempty] - 1]
+        return pd.DatetimeIndex(np.where(last >= 0, self.months.values[last.clip(0)], np.datetime64("NaT")))
+
+    def late_share(self, cutoff) -> np.ndarray:
+        """Share of each row's recipes published from ``cutoff`` onwards."""
+        totals = self.totals()
+        late = self.window_sum(start=cutoff)
+        return np.divide(late, totals, out=np.zeros(len(self)), where=totals > 0)
+
+    def rolling_mean(self, window: int) -> np.ndarray:
+        """Dense trailing ``window``-column mean per row, from cumulative sums.
+
+        Matches ``rolling(window, min_periods=1).mean()`` along the columns.
+        """
+        cum = np.cumsum(self.counts.toarray(), axis=1, dtype=np.float64)
+        shifted = np.zeros_like(cum)
+        shifted[:, window:] = cum[:, :-window]
+        periods = np.minimum(np.arange(1, len(self.months) + 1), window)
+        return (cum - shifted) / periods
+
+    def to_frame(self) -> pd.DataFrame:
+        """Dense DataFrame (contributors × months), for small selections."""
+        return pd.DataFrame(self.counts.toarray(), index=self.contributors, columns=self.months)
+
+
+def activity_features(activity: ActivityMatrix, window: int = 3) -> np.ndarray:
+    """Smoothed activity, Z-score normalised per month."""
+    return StandardScaler().fit_transform(activity.rolling_mean(window))
+
+
+@disk_cache(tables=[])
+def fit_activity_clustering(X: np.ndarray, n_clusters: int, random_state: int = 42) -> dict:
+    """KMeans on the activity features, with its inertia and silhouette score.
+
+    Keyed on ``X`` itself: the fit reads nothing else from the store.
+    """
+    km = KMeans(n_clusters=n_clusters, random_state=random_state)
+    labels = km.fit_predict(X)
+    n_found = len(np.unique(labels))
+    return {
+        "model": km,
+        "labels": labels,
+        "centroids": km.cluster_centers_,
+        "n_clusters": n_found,
+        "inertia": km.inertia_,
+        "silhouette": silhouette_score(X, labels) if 1 < n_found < len(X) else np.nan,
+    }
+
+
+def submit_activity_clusterings(X: np.ndarray, n_clusters_range, random_state: int = 42) -> dict[int, Job]:
+    """Fit one clustering of ``X`` (see :func:`activity_features`) per value
+    of ``n_clusters_range`` in the background.
+
+    Returns ``{n_clusters: Job}`` immediately; each job resolves to the
+    dict of :func:`fit_activity_clustering`. Sessions asking for the same
+    fits share the same jobs.
+    """
+    return {k: run_in_background(fit_activity_clustering, X, k, random_state) for k in n_clusters_range}
+
+
+def clustering_scores(futures: dict[int, Job]) -> pd.DataFrame:
+    """Inertia and silhouette score per number of clusters (waits for all fits)."""
+    return pd.DataFrame(
+        [{"n_clusters": k, "inertia": f.result()["inertia"], "silhouette": f.result()["silhouette"]}
+         for k, f in sorted(futures.items())]
+    ).set_index("n_clusters")
+
+
+def super_core_sweep(
+    activity: ActivityMatrix,
+    cutoffs,
+    min_active_months,
+    percentiles_min_recipes,
+    min_late_shares,
+    active_window=("2008-01-01", "2014-12-31"),
+    n_recipes_total: int | None = None,
+    recent_months: int = 6,
+) -> pd.DataFrame:
+    """Super-core size and recipe share for every combination of thresholds.
+
+    The per-contributor metrics are computed once; each threshold then only
+    costs a broadcast comparison, so a whole grid is evaluated in one pass.
+    Returns one row per ``(cutoff, min_active_months, percentile_min_recipes,
+    min_late_share)`` with the super-core size, how many of its members were
+    active in the last ``recent_months`` months, and its share of recipes.
+    """
+    totals = activity.totals()
+    active = activity.active_months(*active_window)
+    last_pub = activity.last_active()
+    recent = np.asarray(last_pub >= activity.months[-1] - pd.DateOffset(months=recent_months - 1))
+    n_recipes_total = totals.sum() if n_recipes_total is None else n_recipes_total
+
+    min_recipes = np.nanpercentile(totals, np.asarray(percentiles_min_recipes) * 100)
+    # (contributors, thresholds) masks, broadcast to (R, A, P, L) below
+    by_active = active[:, None] >= np.asarray(min_active_months)[None, :]
+    by_recipes = totals[:, None] >= min_recipes[None, :]
+
+    frames = []
+    for cutoff in cutoffs:
+        still_active = np.asarray(last_pub >= pd.Timestamp(cutoff))
+        by_late = activity.late_share(cutoff)[:, None] >= np.asarray(min_late_shares)[None, :]
+        mask = (
+            still_active[:, None, None, None]
+            & by_active[:, :, None, None]
+            & by_recipes[:, None, :, None]
+            & by_late[:, None, None, :]
+        )
+        frames.append(pd.DataFrame(
+            {
+                "n_super_core": mask.sum(axis=0).ravel(),
+                "n_recent": np.tensordot(recent.astype(np.int64), mask, axes=(0, 0)).ravel(),
+                "recipe_share": np.tensordot(totals, mask, axes=(0, 0)).ravel() / n_recipes_total,
+            },
+            index=pd.MultiIndex.from_product(
+                [[cutoff], min_active_months, percentiles_min_recipes, min_late_shares],
+                names=["cutoff", "min_active_months", "percentile_min_recipes", "min_late_share"],
+            ),
+        ))
+    return pd.concat(frames).reset_index()
@@ -0,0 +1,177 @@
+"""Small aggregate tables materialised next to the store.
+
+Pages query these instead of re-running the same group-bys over the raw
+rows on every rerun. Each aggregate declares the store columns it reads;
+its manifest entry records the versions of those tables, so a refresh of
+``interactions`` only rebuilds the aggregates that depend on it.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.store import (
+    STORE_DIR,
+    file_sha256,
+    load_manifest,
+    map_columns,
+    nutrition_categories,
+    save_manifest,
+    table_version,
+)
+
+AGGREGATES_DIR = STORE_DIR / "aggregates"
+
+# name -> (sources, function); sources maps a table to the columns read
+AGGREGATES = {}
+
+
+def aggregate(**sources):
+    """Register an aggregate computed from the given ``table=[columns]``."""
+    def decorator(func):
+        AGGREGATES[func.__name__] = (sources, func)
+        return func
+    return decorator
+
+
+@aggregate(interactions=["rating"])
+def rating_counts(interactions: pd.DataFrame) -> pd.DataFrame:
+    return (
+        interactions["rating"].value_counts().sort_index()
+        .rename_axis("rating").reset_index(name="count")
+    )
+
+
+@aggregate(interactions=["recipe_id"])
+def recipe_evaluations(interactions: pd.DataFrame) -> pd.DataFrame:
+    """Number of evaluations per recipe, most evaluated first."""
+    return (
+        interactions["recipe_id"].value_counts()
+        .rename_axis("recipe_id").reset_index(name="n_evaluated")
+    )
+
+
+@aggregate(interactions=["recipe_id"], recipes=["id"] + nutrition_categories)
+def evaluated_recipes_nutrition(interactions: pd.DataFrame, recipes: pd.DataFrame) -> pd.DataFrame:
+    """``recipe_evaluations`` joined with the nutrition values of each recipe."""
+    return pd.merge(recipes, recipe_evaluations(interactions), left_on="id", right_on="recipe_id")
+
+
+@aggregate(interactions=["user_id"])
+def user_reviews(interactions: pd.DataFrame) -> pd.DataFrame:
+    """Number of reviews (interactions) per user."""
+    return (
+        interactions["user_id"].value_counts()
+        .rename_axis("user_id").reset_index(name="n_reviews")
+    )
+
+
+@aggregate(recipes=["contributor_id"])
+def contributor_recipes(recipes: pd.DataFrame) -> pd.DataFrame:
+    return (
+        recipes["contributor_id"].value_counts()
+        .rename_axis("contributor_id").reset_index(name="n_recipes")
+    )
+
+
+@aggregate(recipes=["contributor_id", "id", "submitted_year", "submitted_month"])
+def contributor_months(recipes: pd.DataFrame) -> pd.DataFrame:
+    """Distinct recipes per contributor and month (long form of the activity matrix)."""
+    recipes = recipes[recipes["submitted_year"] >= 0]
+    month = recipes["submitted_month"].to_numpy().astype("datetime64[M]").astype("datetime64[ns]")
+    return (
+        recipes.assign(month=month)
+        .groupby(["contributor_id", "month"])["id"].nunique()
+        .reset_index(name="n_recipes")
+    )
+
+
+@aggregate(recipes=["submitted_year", "submitted_month", "submitted_weekday"])
+def submissions_by_day(recipes: pd.DataFrame) -> pd.DataFrame:
+    """Recipes submitted per year, month and weekday (Monday = 0)."""
+    recipes = recipes[recipes["submitted_year"] >= 0]
+    return (
+        pd.DataFrame({
+            "year": recipes["submitted_year"].to_numpy(),
+            "month": (recipes["submitted_month"].to_numpy() % 12 + 1).astype(np.int8),
+            "weekday": recipes["submitted_weekday"].to_numpy(),
+        })
+        .value_counts().sort_index().reset_index(name="count")
+    )
+
+
+def submissions_cube(by_day: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Dense ``year × month × weekday`` counts from ``submissions_by_day``.
+
+    Returns ``(years, cube)`` where ``cube[i, m, d]`` counts the recipes
+    submitted in ``years[i]``, month ``m + 1`` and weekday ``d``. Any year
+    interval and weekday selection is then a slice of ``cube``.
+    """
+    years = np.arange(by_day["year"].min(), by_day["year"].max() + 1)
+    cube = np.zeros((len(years), 12, 7), dtype=np.int64)
+    np.add.at(
+        cube,
+        (
+            by_day["year"].to_numpy() - years[0],
+            by_day["month"].to_numpy() - 1,
+            by_day["weekday"].to_numpy(),
+        ),
+        by_day["count"].to_numpy(),
+    )
+    return years, cube
+
+
+def aggregate_path(name: str):
+    return AGGREGATES_DIR / f"{name}.parquet"
+
+
+def source_versions(name: str, manifest: dict | None = None) -> dict:
+    sources, _ = AGGREGATES[name]
+    return {table: table_version(table, manifest) for table in sorted(sources)}
+
+
+def compute_aggregate(name: str, manifest: dict | None = None) -> pd.DataFrame:
+    sources, func = AGGREGATES[name]
+    return func(**{table: map_columns(table, columns, manifest) for table, columns in sources.items()})
+
+
+def is_fresh(name: str, manifest: dict | None = None) -> bool:
+    manifest = load_manifest() if manifest is None else manifest
+    entry = manifest.get("aggregates", {}).get(name)
+    return (
+        entry is not None
+        and entry["sources"] == source_versions(name, manifest)
+        and aggregate_path(name).exists()
+    )
+
+
+def build_aggregates(force: bool = False) -> list[str]:
+    """(Re)build the aggregates whose source tables changed; return their names."""
+    manifest = load_manifest()
+    AGGREGATES_DIR.mkdir(parents=True, exist_ok=True)
+    rebuilt = []
+    for name in AGGREGATES:
+        if not force and is_fresh(name, manifest):
+            continue
+        df = compute_aggregate(name, manifest)
+        path = aggregate_path(name)
+        tmp_path = path.with_suffix(".parquet.tmp")
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        manifest.setdefault("aggregates", {})[name] = {
+            "file": path.name,
+            "rows": len(df),
+            "sha256": file_sha256(path),
+            "sources": source_versions(name, manifest),
+        }
+        rebuilt.append(name)
+    save_manifest(manifest)
+    return rebuilt
+
+
+def read_aggregate(name: str) -> pd.DataFrame:
+    """Materialised ``name``, or computed on the fly if the store moved on since."""
+    manifest = load_manifest()
+    if is_fresh(name, manifest):
+        return pd.read_parquet(aggregate_path(name))
+    return compute_aggregate(name, manifest)
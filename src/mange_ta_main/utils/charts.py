@@ -0,0 +1,186 @@
+"""Plotly helpers that aggregate on the server.
+
+A figure built from raw rows embeds every value in the page's JSON and
+lets the browser do the binning. These helpers reduce the data with NumPy
+first, so only what is drawn is sent.
+
+Scatter plots switch to WebGL above ``WEBGL_POINTS`` points. Above
+``MAX_POINTS`` they are either sampled (stratified, outliers kept) or
+replaced by a 2-D density heatmap binned on the server, so the payload
+and render time stay bounded whatever the number of rows.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# SVG scatter traces get slow in the browser past a few thousand points
+WEBGL_POINTS = 2_000
+MAX_POINTS = 20_000
+# Points outside these quantiles of x or y are always kept when sampling
+OUTLIER_QUANTILES = (0.005, 0.995)
+
+
+def histogram_bins(values, nbins: int, weights=None) -> tuple[np.ndarray, np.ndarray]:
+    """``(counts, edges)`` of ``values`` in about ``nbins`` bins.
+
+    ``weights`` turns pre-aggregated data (distinct values and their
+    counts, e.g. an aggregate table) into the same histogram as the raw
+    rows. Integer data get integer-wide bins centred on the values, so a
+    handful of distinct values (ratings) gets one bar each, like
+    ``px.histogram`` whose ``nbins`` is also only a hint.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    values = values[finite]
+    if weights is not None:
+        weights = np.asarray(weights)[finite]
+    if values.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(1)
+
+    lo, hi = values.min(), values.max()
+    if np.array_equal(values, np.round(values)):
+        width = max(1, int((hi - lo + 1) // nbins))
+        n = int(np.ceil((hi - lo + 1) / width))
+        bins = lo - 0.5 + width * np.arange(n + 1)
+    else:
+        bins = nbins
+    return np.histogram(values, bins=bins, weights=weights)
+
+
+def histogram_trace(counts: np.ndarray, edges: np.ndarray, **kwargs) -> go.Bar:
+    """Bar trace drawing precomputed bins: one bar per bin, edge to edge."""
+    return go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate="[%{customdata[0]:.4g}, %{customdata[1]:.4g}]: %{y}<extra></extra>",
+        **kwargs,
+    )
+
+
+def histogram_figure(values, nbins: int, weights=None, title=None, x_title=None, y_title="Frequence", **kwargs) -> go.Figure:
+    """Histogram figure binned server-side; ``kwargs`` go to the bar trace."""
+    fig = go.Figure(histogram_trace(*histogram_bins(values, nbins, weights), **kwargs))
+    fig.update_layout(title=title, xaxis_title=x_title, yaxis_title=y_title)
+    return fig
+
+
+def stratified_sample(x, y, n: int, groups=None, seed: int = 0) -> np.ndarray:
+    """Sorted indices of at most ``n`` points of ``(x, y)``.
+
+    Points outside ``OUTLIER_QUANTILES`` of either axis are kept (up to
+    half of ``n``), the rest is drawn per group in proportion to its size.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) <= n:
+        return np.arange(len(x))
+    rng = np.random.default_rng(seed)
+
+    outside = np.zeros(len(x), dtype=bool)
+    for values in (x, y):
+        lo, hi = np.nanquantile(values, OUTLIER_QUANTILES)
+        outside |= (values < lo) | (values > hi)
+    outliers = np.flatnonzero(outside)
+    if len(outliers) > n // 2:
+        outliers = rng.choice(outliers, n // 2, replace=False)
+
+    rest = np.flatnonzero(~outside)
+    budget = n - len(outliers)
+    groups = np.zeros(len(x), dtype=np.int8) if groups is None else np.asarray(groups)
+    values, inverse = np.unique(groups[rest], return_inverse=True)
+    sizes = np.bincount(inverse, minlength=len(values))
+    picked = [outliers]
+    for g, size in enumerate(sizes):
+        members = rest[inverse == g]
+        picked.append(rng.choice(members, min(size, budget * size // len(rest)), replace=False))
+    return np.sort(np.concatenate(picked))
+
+
+def scatter_trace(x, y, webgl: bool | None = None, **kwargs):
+    """Marker trace, WebGL when ``webgl`` (by default, above ``WEBGL_POINTS`` points)."""
+    if webgl is None:
+        webgl = len(x) > WEBGL_POINTS
+    return (go.Scattergl if webgl else go.Scatter)(x=x, y=y, mode="markers", **kwargs)
+
+
+def density_trace(x, y, nbins: int = 100, **kwargs) -> go.Heatmap:
+    """2-D histogram of ``(x, y)`` binned server-side, empty cells left blank."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    counts, x_edges, y_edges = np.histogram2d(x[finite], y[finite], bins=nbins)
+    return go.Heatmap(
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        z=np.where(counts.T > 0, counts.T, np.nan),
+        colorscale="Viridis",
+        colorbar={"title": "Points"},
+        **kwargs,
+    )
+
+
+def scatter_figure(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    color: str | None = None,
+    overflow: str = "sample",
+    max_points: int = MAX_POINTS,
+    webgl_points: int = WEBGL_POINTS,
+    colors=None,
+    title=None,
+    **marker,
+) -> go.Figure:
+    """Scatter of ``df[x]`` against ``df[y]``, one trace per ``color`` value.
+
+    ``colors`` is either a sequence, used in the sorted order of the
+    ``color`` values, or a ``{value: color}`` mapping, so that another
+    view (a table) can reuse the same colors.
+
+    Above ``max_points`` rows, ``overflow="sample"`` draws a stratified
+    sample (per ``color`` group, outliers kept) and ``overflow="density"``
+    draws a density heatmap instead of points.
+    """
+    fig = go.Figure()
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y)
+    if len(df) > max_points and overflow == "density":
+        fig.add_trace(density_trace(df[x], df[y]))
+        return fig
+
+    groups = None if color is None else df[color].to_numpy()
+    if colors is not None and not isinstance(colors, dict):
+        # Before sampling: a group left out of the sample keeps its color
+        colors = {value: colors[i % len(colors)] for i, value in enumerate(np.unique(groups))}
+    rows = stratified_sample(df[x], df[y], max_points, groups)
+    if len(rows) < len(df):
+        fig.update_layout(title=f"{title or ''} ({len(rows):,} of {len(df):,} points)")
+    df = df.iloc[rows]
+    # The threshold applies to the whole figure, not to each trace
+    webgl = len(df) > webgl_points
+    if color is None:
+        fig.add_trace(scatter_trace(df[x], df[y], webgl, marker=marker))
+        return fig
+    for value, group in df.groupby(color, sort=True):
+        group_marker = dict(marker)
+        if colors is not None:
+            group_marker["color"] = colors[value]
+        fig.add_trace(scatter_trace(group[x], group[y], webgl, marker=group_marker, name=str(value)))
+    fig.update_layout(legend_title=color)
+    return fig
+
+
+def lorenz_figure(curves: dict, title=None, x_title="Cumulative share of population", y_title="Cumulative share of total", points: int = 200) -> go.Figure:
+    """Downsampled Lorenz curves (``{name: Concentration}``) and the equality line."""
+    fig = go.Figure()
+    for name, concentration in curves.items():
+        x, y = concentration.curve(points)
+        fig.add_trace(go.Scatter(x=x, y=y, name=name))
+    fig.add_trace(go.Scatter(
+        x=[0, 1],
+        y=[0, 1],
+        name="Perfect Equality",
+        line={"color": "orange", "width": 1, "dash": "dash"}))
+    fig.update_layout(title=title, xaxis_title=x_title, yaxis_title=y_title)
+    return fig
@@ -0,0 +1,52 @@
+"""Concentration of a count over a population (Lorenz curve, Gini, top shares).
+
+:class:`Concentration` sorts the counts once and keeps their cumulative
+sums; every metric is then read from that array, and the curve sent to
+the browser is downsampled to a bounded number of points.
+"""
+import numpy as np
+
+
+class Concentration:
+    """Lorenz curve of ``counts`` (recipes per contributor, reviews per user...)."""
+
+    def __init__(self, counts):
+        counts = np.sort(np.asarray(counts, dtype=np.float64))
+        self.n = len(counts)
+        self.cumulative = np.cumsum(counts)
+        self.total = float(self.cumulative[-1]) if self.n else 0.0
+
+    def gini(self) -> float:
+        """Gini coefficient: 0 for perfect equality, close to 1 when one member holds everything."""
+        if not self.n or not self.total:
+            return 0.0
+        return float((self.n + 1 - 2 * self.cumulative.sum() / self.total) / self.n)
+
+    def top_share(self, fraction: float) -> float:
+        """Share of the total held by the top ``fraction`` of the population (at least one member)."""
+        if not self.n or not self.total:
+            return 0.0
+        k = min(self.n, max(1, int(np.floor(fraction * self.n))))
+        rest = self.cumulative[self.n - k - 1] if k < self.n else 0.0
+        return (self.total - rest) / self.total
+
+    def curve(self, points: int = 200) -> tuple[np.ndarray, np.ndarray]:
+        """Lorenz curve from ``(0, 0)`` to ``(1, 1)`` in at most ``2 * points`` points.
+
+        Points are kept at regular steps of both the population and the
+        cumulative share, so the polyline is within ``1 / (points - 1)`` of
+        the full curve along either axis.
+        """
+        if not self.n or not self.total:
+            return np.array([0.0, 1.0]), np.array([0.0, 1.0])
+        shares = self.cumulative / self.total
+        steps = np.linspace(0, 1, points)
+        kept = np.union1d(
+            np.ceil(steps * self.n).astype(np.int64),
+            np.searchsorted(shares, steps) + 1,
+        )
+        kept = kept[(kept >= 1) & (kept <= self.n)]
+        return (
+            np.concatenate([[0.0], kept / self.n]),
+            np.concatenate([[0.0], shares[kept - 1]]),
+        )
@@ -1,47 +1,300 @@
-from pathlib import Path
+import functools
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 
-DATA_DIR = Path("Data")
-RECIPES_PICKLE_FILE = DATA_DIR / "RAW_recipes_local.pkl"
-INTERACTIONS_PICKLE_FILE = DATA_DIR / "RAW_interactions_local.pkl"
+from utils.aggregates import read_aggregate, source_versions, submissions_cube
+from utils.concentration import Concentration
+from utils.store import (
+    DATA_DIR,
+    MAPPED_COLUMNS,
+    SCHEMAS,
+    EncodedList,
+    map_columns,
+    map_list,
+    nutrition_categories,
+    partition_key,
+    partition_years,
+    read_table,
+    require_table,
+    select_rows,
+    table_version,
+)
+from utils.trimming import DEFAULT_QUANTILES, quantile_bounds, within_bounds
+
 TAGS_COOCURENCE = DATA_DIR / "tags_coocurence.pkl"
 
-nutrition_categories = [
-    "Calories",
-    "Total fat",
-    "Sugar",
-    "Sodium",
-    "Protein",
-    "Saturated fat",
-    "Carbohydrates",
-]
-
-
-@st.cache_data
-def load_interactions() -> pd.DataFrame:
-    return pd.read_pickle(INTERACTIONS_PICKLE_FILE)
-
-
-@st.cache_data
-def load_recipes() -> pd.DataFrame:
-    recipes = pd.read_pickle(RECIPES_PICKLE_FILE.resolve())
-    # Séparation des données nutritionnelles
-    nutrition_split = (
-        recipes["nutrition"]
-        .str.strip("[]")
-        .str.replace(" ", "", regex=False)
-        .str.split(",", expand=True)
-    )
-    nutrition_split.columns = nutrition_categories
-    nutrition_split = nutrition_split.astype(float)
-    # Fusion et nettoyage
-    recipes = pd.concat([recipes, nutrition_split], axis=1)
-    recipes.drop(columns=["nutrition"], inplace=True)
-
-    return recipes
-
-
-@st.cache_data
+# Copy-on-write : un frame dérivé d'un frame partagé (sélection, nouvelle
+# colonne, assign...) ne copie que ce qu'il modifie, et n'écrit jamais dans
+# les tableaux en lecture seule gardés par les caches ci-dessous
+pd.set_option("mode.copy_on_write", True)
+
+
+def freeze(value):
+    """Make the arrays of ``value`` (frame, series, array, or a tuple or dict of them) read-only."""
+    if isinstance(value, tuple):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return {k: freeze(v) for k, v in value.items()}
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+        return value
+    if isinstance(value, pd.Series):
+        return pd.Series(freeze(value.to_numpy()), index=value.index, name=value.name, copy=False)
+    if isinstance(value, pd.DataFrame):
+        return pd.DataFrame(
+            {col: freeze(values.to_numpy()) for col, values in value.items()},
+            index=value.index,
+            copy=False,
+        )
+    return value
+
+
+def _view(value):
+    # Une copie superficielle est suivie par le copy-on-write : écrire dedans
+    # copie la colonne au lieu de toucher le tableau partagé
+    if isinstance(value, tuple):
+        return tuple(_view(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _view(v) for k, v in value.items()}
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        return value.copy(deep=False)
+    return value
+
+
+def cache_shared(func):
+    """``st.cache_resource`` for data: the result is built once per process,
+    with read-only arrays, and every call gets a view of it.
+
+    Unlike ``st.cache_data``, nothing is pickled or copied on a rerun. The
+    views are copy-on-write, so a page adding or changing columns only
+    copies what it changes and never alters the shared data.
+    """
+    shared = st.cache_resource(functools.wraps(func)(lambda *args, **kwargs: freeze(func(*args, **kwargs))))
+
+    @functools.wraps(func)
+    def view(*args, **kwargs):
+        return _view(shared(*args, **kwargs))
+
+    view.clear = shared.clear
+    return view
+
+
+@cache_shared
+def _load_column(name: str, version: str, column: str, years: tuple[int, int] | None) -> pd.Series:
+    # `version` ne sert qu'à la clé de cache : une nouvelle partition de
+    # `name` invalide ses entrées sans toucher à celles des autres tables.
+    # Une entrée par colonne : une page étroite ne charge jamais les textes
+    return read_table(name, [column], years)[column]
+
+
+@st.cache_resource
+def _map_column(name: str, version: str, column: str) -> np.ndarray:
+    # cache_resource ne copie pas : tous les appels partagent les memmaps
+    return map_columns(name, [column])[column].to_numpy()
+
+
+@st.cache_resource
+def _select_rows(name: str, version: str, where: tuple) -> np.ndarray:
+    return freeze(select_rows(name, dict(where)))
+
+
+@cache_shared
+def _select_column(name: str, version: str, column: str, where: tuple) -> np.ndarray:
+    rows = _select_rows(name, version, where)
+    if column in MAPPED_COLUMNS[name]:
+        return _map_column(name, version, column)[rows]
+    series = _load_column(name, version, column, partition_years(name, dict(where)))
+    # Les partitions lues couvrent les lignes retenues, et plus
+    return series.to_numpy()[np.searchsorted(series.index, rows)]
+
+
+def _column(name: str, version: str, column: str, where: tuple) -> np.ndarray:
+    if where:
+        return _select_column(name, version, column, where)
+    if column in MAPPED_COLUMNS[name]:
+        return _map_column(name, version, column)
+    return _load_column(name, version, column, None).to_numpy()
+
+
+@cache_shared
+def _frame(name: str, version: str, columns: tuple[str, ...], where: tuple) -> pd.DataFrame:
+    # Le frame de base reste dans le cache : les vues rendues aux pages en
+    # dépendent, c'est ce qui déclenche le copy-on-write à la première écriture
+    index = pd.RangeIndex(require_table(name)["rows"]) if not where else pd.Index(_select_rows(name, version, where))
+    return pd.DataFrame({col: _column(name, version, col, where) for col in columns}, index=index, copy=False)
+
+
+class LazyFrame:
+    """Projection of a store table whose columns are read on first access.
+
+    ``columns`` and the row predicate ``where`` (``{column: (low, high)}``,
+    inclusive, ``None`` for an open side) are fixed at creation. Selecting
+    columns loads only those, each from the shared memmaps or its own
+    Parquet cache entry, and :meth:`head` decodes only the first rows. The
+    index is the store row, as for :func:`load_recipes`.
+
+    Frames are views of read-only arrays shared by every session: writing
+    to one copies the columns written, never the shared data.
+    """
+
+    def __init__(self, name: str, columns: list[str] | None = None, where: dict | None = None):
+        schema = SCHEMAS[name].names
+        unknown = [col for col in columns or [] if col not in schema]
+        if unknown:
+            raise KeyError(f"Unknown columns for {name!r}: {unknown}")
+        self.name = name
+        self.columns = list(schema if columns is None else columns)
+        self.where = dict(where or {})
+        self._version = table_version(name)
+        self._years = partition_years(name, self.where)
+        self._where = tuple(sorted(self.where.items()))
+        self._rows = _select_rows(name, self._version, self._where) if self.where else None
+        self.index = pd.RangeIndex(require_table(name)["rows"]) if self._rows is None else pd.Index(self._rows)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self[[key]][key]
+        missing = [col for col in key if col not in self.columns]
+        if missing:
+            raise KeyError(missing)
+        # Nouveau DataFrame à chaque appel (les ajouts de colonnes d'une page ne
+        # fuient pas dans le cache), mais sans recopier les données
+        return _frame(self.name, self._version, tuple(key), self._where)
+
+    def to_pandas(self) -> pd.DataFrame:
+        return self[self.columns]
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        """First ``n`` rows, read without loading whole Parquet columns."""
+        rows = self.index[:n].to_numpy()
+        arrays = {}
+        mapped = [col for col in self.columns if col in MAPPED_COLUMNS[self.name]]
+        for col in mapped:
+            arrays[col] = _map_column(self.name, self._version, col)[rows]
+        other = [col for col in self.columns if col not in mapped]
+        if other:
+            table = read_table(self.name, other, self._years, rows)
+            arrays.update((col, values.to_numpy()) for col, values in table.items())
+        return pd.DataFrame({col: arrays[col] for col in self.columns}, index=rows)
+
+
+def _where(name: str, years: tuple[int, int] | None, where: dict | None) -> dict:
+    where = dict(where or {})
+    if years is not None:
+        where[partition_key(name)] = (int(years[0]), int(years[1]))
+    return where
+
+
+def scan_interactions(
+    columns: list[str] | None = None, years: tuple[int, int] | None = None, where: dict | None = None
+) -> LazyFrame:
+    return LazyFrame("interactions", columns, _where("interactions", years, where))
+
+
+def scan_recipes(
+    columns: list[str] | None = None, years: tuple[int, int] | None = None, where: dict | None = None
+) -> LazyFrame:
+    return LazyFrame("recipes", columns, _where("recipes", years, where))
+
+
+def load_interactions(
+    columns: list[str] | None = None, years: tuple[int, int] | None = None, where: dict | None = None
+) -> pd.DataFrame:
+    """``columns`` of the interactions matching ``years``/``where`` (see :class:`LazyFrame`)."""
+    return scan_interactions(columns, years, where).to_pandas()
+
+
+def load_recipes(
+    columns: list[str] | None = None, years: tuple[int, int] | None = None, where: dict | None = None
+) -> pd.DataFrame:
+    """``columns`` of the recipes matching ``years``/``where`` (see :class:`LazyFrame`)."""
+    # Les colonnes nutritionnelles sont déjà séparées et typées à l'import
+    return scan_recipes(columns, years, where).to_pandas()
+
+
+@st.cache_resource
+def _map_list(name: str, version: str, column: str) -> EncodedList:
+    return map_list(name, column)
+
+
+def load_list_column(column: str, name: str = "recipes") -> EncodedList:
+    """Encoded ``tags``/``ingredients`` (offsets + codes + vocabulary), aligned
+    with the rows returned by :func:`load_recipes`."""
+    return _map_list(name, table_version(name), column)
+
+
+@cache_shared
+def _load_trim_mask(name: str, version: str, columns: tuple[str, ...], quantiles: tuple[float, float]):
+    values = map_columns(name, list(columns))
+    return within_bounds(values, quantile_bounds(values, *quantiles))
+
+
+def load_trim_mask(
+    name: str,
+    columns: list[str],
+    quantiles: tuple[float, float] = DEFAULT_QUANTILES,
+):
+    """Rows of ``name`` whose ``columns`` all lie within ``quantiles``.
+
+    Bounds and mask are computed once per table version, so every page
+    trimming the same columns shares the same cleaned subset.
+    """
+    return _load_trim_mask(name, table_version(name), tuple(columns), tuple(quantiles))
+
+
+@cache_shared
+def _load_aggregate(name: str, versions: dict) -> pd.DataFrame:
+    return read_aggregate(name)
+
+
+def load_aggregate(name: str) -> pd.DataFrame:
+    """Materialised aggregate ``name`` (see ``utils/aggregates.py``)."""
+    return _load_aggregate(name, source_versions(name))
+
+
+@st.cache_resource
+def _load_concentration(name: str, column: str, versions: dict) -> Concentration:
+    return Concentration(read_aggregate(name)[column].to_numpy())
+
+
+def load_concentration(name: str, column: str) -> Concentration:
+    """Lorenz curve of ``column`` of aggregate ``name``, sorted once per dataset."""
+    return _load_concentration(name, column, source_versions(name))
+
+
+@cache_shared
+def _load_submissions_cube(versions: dict):
+    return submissions_cube(read_aggregate("submissions_by_day"))
+
+
+def load_submissions_cube():
+    """``(years, cube)`` of recipes per year × month × weekday, built once."""
+    return _load_submissions_cube(source_versions("submissions_by_day"))
+
+
+@st.cache_resource
+def _map_nutrition_clusters(version: str):
+    # Import local : sklearn n'est chargé que par les pages qui en ont besoin
+    from utils.nutrition_clusters import read_nutrition_clusters
+
+    return read_nutrition_clusters()
+
+
+def load_nutrition_clusters() -> pd.DataFrame:
+    """Nutrition cluster and 2D PCA projection of every recipe, aligned with
+    the rows returned by :func:`load_recipes` (see ``utils/nutrition_clusters.py``).
+
+    The clusters are computed by ``init_data``: raises ``FileNotFoundError``
+    if they are missing or older than the recipes table."""
+    labels, pcs = _map_nutrition_clusters(table_version("recipes"))
+    return pd.DataFrame({"cluster": labels, "PC1": pcs[:, 0], "PC2": pcs[:, 1]}, copy=False)
+
+
+@cache_shared
 def load_tags() -> pd.DataFrame:
     return pd.read_pickle(DATA_DIR / "tags_coocurence.csv")
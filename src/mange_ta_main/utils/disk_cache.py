@@ -0,0 +1,206 @@
+"""Persistent, size-bounded cache for expensive intermediate results.
+
+Unlike ``st.cache_data``, entries survive a restart of the service. A key
+combines the versions of the store tables the function reads (the whole
+store unless it declares ``tables``), a hash of the code it runs (its
+module and the ``utils`` modules that one uses) and its arguments, so new
+data or edited code never serves a stale result. Entries are pickles written atomically; the least recently used
+ones are evicted once the cache exceeds its size budget. File locks make
+concurrent access from several Streamlit processes safe, and only one
+process computes a missing entry while the others wait for it.
+"""
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from utils.store import STORE_DIR, dataset_version, table_version
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+CACHE_DIR = STORE_DIR / "cache"
+DEFAULT_MAX_MB = float(os.environ.get("MANGE_TA_MAIN_CACHE_MB", 1024))
+# Per-key locks are striped over a fixed set of files
+LOCK_STRIPES = 64
+
+_MISS = object()
+
+
+def _update(digest, value) -> None:
+    """Feed a stable representation of ``value`` into ``digest``."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        digest.update(type(value).__name__.encode())
+        meta = list(value.columns) if isinstance(value, pd.DataFrame) else value.name
+        digest.update(repr((meta, value.dtypes)).encode())
+        try:
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        except TypeError:  # unhashable cells, e.g. list columns
+            digest.update(pickle.dumps(value))
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        digest.update(f"{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f"dict{len(value)}".encode())
+        for k in sorted(value, key=repr):
+            _update(digest, k)
+            _update(digest, value[k])
+    else:
+        digest.update(pickle.dumps(value))
+
+
+@functools.lru_cache(maxsize=256)
+def _file_hash(path: str, mtime_ns: int) -> bytes:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def _is_utils(module_name) -> bool:
+    return isinstance(module_name, str) and (module_name == "utils" or module_name.startswith("utils."))
+
+
+def _code_files(filename: str, namespace: dict, files: dict) -> None:
+    """Add ``filename`` and, transitively, the ``utils`` modules ``namespace`` uses."""
+    if filename in files:
+        return
+    files[filename] = None
+    for value in list(namespace.values()):
+        name = value.__name__ if inspect.ismodule(value) else getattr(value, "__module__", None)
+        module = sys.modules.get(name) if _is_utils(name) else None
+        if getattr(module, "__file__", None):
+            _code_files(module.__file__, vars(module), files)
+
+
+def source_hash(func) -> str:
+    """Hash of the code ``func`` may run: its module (a page or a ``utils``
+    module) and every ``utils`` module reachable from it, so an edited
+    callee also changes the key. Decorators are looked through."""
+    func = inspect.unwrap(func)
+    files = {}
+    _code_files(func.__code__.co_filename, func.__globals__, files)
+    digest = hashlib.sha256()
+    for filename in sorted(files):
+        try:
+            digest.update(_file_hash(filename, os.stat(filename).st_mtime_ns))
+        except OSError:  # defined interactively: only its bytecode is known
+            digest.update(func.__code__.co_code)
+    return digest.hexdigest()
+
+
+def data_version(tables=None) -> dict | str:
+    """Versions of ``tables`` (names of store tables), of the whole store if None."""
+    if tables is None:
+        return dataset_version()
+    return {name: table_version(name) for name in sorted(tables)}
+
+
+def cache_key(func, code_hash: str, args: tuple, kwargs: dict, tables=None) -> str:
+    digest = hashlib.sha256()
+    _update(digest, (func.__module__, func.__qualname__, code_hash, data_version(tables)))
+    _update(digest, (args, kwargs))
+    return digest.hexdigest()
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on ``path`` across threads and processes (no-op on Windows)."""
+    if fcntl is None:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            value = pickle.load(f)
+    except FileNotFoundError:
+        return _MISS
+    except (EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        # Truncated entry, or pickled by code that no longer exists
+        path.unlink(missing_ok=True)
+        return _MISS
+    try:
+        os.utime(path)  # mark as recently used
+    except FileNotFoundError:
+        pass
+    return value
+
+
+def _write(path, value) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f.name, path)
+
+
+def evict(max_mb: float = DEFAULT_MAX_MB) -> int:
+    """Delete least recently used entries until the cache fits in ``max_mb``."""
+    with file_lock(CACHE_DIR / "evict.lock"):
+        entries = []
+        for path in CACHE_DIR.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_mb * 1024 * 1024:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+    return removed
+
+
+def disk_cache(func=None, *, max_mb: float = DEFAULT_MAX_MB, tables=None):
+    """Decorator persisting ``func``'s results in ``CACHE_DIR``.
+
+    ``tables`` names the store tables ``func`` reads besides its arguments:
+    only a change to those invalidates its entries (any table by default).
+    Stack it under ``st.cache_data`` (or ``cache_shared``) so that reruns hit
+    memory first and a restarted process hits disk instead of recomputing.
+    """
+    if func is None:
+        return functools.partial(disk_cache, max_mb=max_mb, tables=tables)
+    code_hash = source_hash(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = cache_key(func, code_hash, args, kwargs, tables)
+        path = CACHE_DIR / f"{key}.pkl"
+        value = _read(path)
+        if value is not _MISS:
+            return value
+        with file_lock(CACHE_DIR / f"key-{int(key, 16) % LOCK_STRIPES:02d}.lock"):
+            # Another process may have computed it while we waited
+            value = _read(path)
+            if value is _MISS:
+                value = func(*args, **kwargs)
+                _write(path, value)
+        evict(max_mb)
+        return value
+
+    wrapper.tables = tables
+    return wrapper
@@ -0,0 +1,63 @@
+"""Sorted-value index answering threshold counts by binary search.
+
+Counting the rows at or under a threshold with a boolean scan costs a pass
+over every row for every query. :class:`DistributionIndex` sorts each
+column once, for all rows and for each group of a labelling, after which
+any threshold is a ``searchsorted`` per column and group.
+"""
+import numpy as np
+import pandas as pd
+
+
+class DistributionIndex:
+    """Sorted values of each column of ``values``, overall and per label.
+
+    ``NaN`` values are left out, like in ``(column <= threshold).sum()``.
+    """
+
+    def __init__(self, values: pd.DataFrame, labels: pd.Series | None = None):
+        self.columns = list(values.columns)
+        self._sorted = {None: self._sort(values)}
+        if labels is not None:
+            labels = np.asarray(labels)
+            for label in np.unique(labels):
+                self._sorted[label] = self._sort(values[labels == label])
+
+    @staticmethod
+    def _sort(values: pd.DataFrame) -> dict:
+        sorted_values = {}
+        for col in values.columns:
+            column = values[col].to_numpy(dtype=np.float64)
+            sorted_values[col] = np.sort(column[~np.isnan(column)])
+        return sorted_values
+
+    @property
+    def labels(self) -> list:
+        return [label for label in self._sorted if label is not None]
+
+    def count_at_most(self, threshold: float, labels=None) -> pd.Series:
+        """Rows with a value ``<= threshold`` per column, over ``labels`` (all rows if None)."""
+        groups = [None] if labels is None else list(labels)
+        return pd.Series(
+            {
+                col: sum(
+                    int(np.searchsorted(self._sorted[g][col], threshold, side="right"))
+                    for g in groups if g in self._sorted
+                )
+                for col in self.columns
+            },
+            dtype=np.int64,
+        )
+
+    def count(self, labels=None) -> pd.Series:
+        """Non-missing values per column, over ``labels`` (all rows if None)."""
+        groups = [None] if labels is None else list(labels)
+        return pd.Series(
+            {col: sum(len(self._sorted[g][col]) for g in groups if g in self._sorted) for col in self.columns},
+            dtype=np.int64,
+        )
+
+    def split(self, threshold: float, labels=None) -> pd.DataFrame:
+        """Counts at or under and above ``threshold``, one row per column."""
+        at_most = self.count_at_most(threshold, labels)
+        return pd.DataFrame({"at_most": at_most, "above": self.count(labels) - at_most})
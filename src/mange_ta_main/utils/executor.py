@@ -0,0 +1,168 @@
+"""Background execution of heavy page computations.
+
+:func:`run_in_background` submits a computation to one thread pool shared
+by every session and returns a :class:`Job` at once, so the page can draw
+its narrative and a progress bar instead of blocking on the result.
+Identical requests (same function, arguments and dataset) share one job,
+whether it is still running or finished: finished jobs are kept in the
+size-bounded memory cache (see ``utils/memory_cache.py``).
+
+The computation reports its progress with :func:`report_progress`, and
+:func:`wait_for` renders it on the page until the job is done.
+"""
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from threadpoolctl import threadpool_limits
+
+from utils.disk_cache import cache_key, source_hash
+from utils.memory_cache import CACHE
+
+MAX_WORKERS = int(os.environ.get("MANGE_TA_MAIN_WORKERS", os.cpu_count() or 1))
+# Native (BLAS/OpenMP) threads of one job, so that the pool as a whole uses
+# about one thread per core
+THREADS_PER_JOB = int(os.environ.get("MANGE_TA_MAIN_JOB_THREADS", max(1, (os.cpu_count() or 1) // MAX_WORKERS)))
+# Seconds between two refreshes of a progress bar
+POLL_SECONDS = 0.5
+
+_pool = None
+_inflight = {}
+_lock = threading.Lock()
+_current = threading.local()
+
+
+def pool() -> ThreadPoolExecutor:
+    """The worker pool shared by all sessions.
+
+    Threads rather than processes: Streamlit runs pages as ``__main__``,
+    which spawned workers would re-execute, and the heavy NumPy/scikit-learn
+    kernels release the GIL anyway. Those kernels start their own native
+    threads, one per core by default: each worker is limited to
+    ``THREADS_PER_JOB`` of them (see :func:`_run`) so that concurrent jobs
+    do not oversubscribe the CPU.
+    """
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="mange-ta-main")
+        return _pool
+
+
+class Job:
+    """A submitted computation: its future and the last progress it reported."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.fraction = 0.0
+        self.message = ""
+        self.future = None
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def failed(self) -> bool:
+        return self.future.done() and self.future.exception() is not None
+
+    def result(self, timeout: float | None = None):
+        return self.future.result(timeout)
+
+
+def report_progress(fraction: float, message: str = "") -> None:
+    """Report the progress of the job running in this thread (no-op elsewhere)."""
+    job = getattr(_current, "job", None)
+    if job is not None:
+        job.fraction = min(max(float(fraction), 0.0), 1.0)
+        job.message = message
+
+
+def _run(job: Job, func, args, kwargs):
+    # Set before each job, as libraries may have been loaded since the last
+    # one: the OpenMP limit is per worker thread, the BLAS one process-wide
+    threadpool_limits(THREADS_PER_JOB)
+    _current.job = job
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _current.job = None
+
+
+def run_in_background(func, *args, **kwargs) -> Job:
+    """Job computing ``func(*args, **kwargs)`` in the shared pool.
+
+    An identical job already running or finished is returned instead of
+    starting a new one; a failed job is retried on the next request. Jobs
+    are told apart like ``disk_cache`` entries, on the store tables named
+    by ``func.tables`` (all of them when unset).
+    """
+    return _submit(func, getattr(func, "tables", None), args, kwargs)
+
+
+def _submit(func, tables, args: tuple, kwargs: dict) -> Job:
+    name = f"{func.__module__}.{func.__qualname__}"
+    key = cache_key(func, source_hash(func), args, kwargs, tables)
+    job = CACHE.get(name, key, None)
+    if job is not None and not job.failed():
+        return job
+    workers = pool()
+    with _lock:
+        job = _inflight.get(key)
+        if job is None:
+            job = Job(name)
+            _inflight[key] = job
+            job.future = workers.submit(_run, job, func, args, kwargs)
+            job.future.add_done_callback(lambda _: _inflight.pop(key, None))
+    CACHE.put(name, key, job)
+    return job
+
+
+def background(func=None, *, tables=None):
+    """Decorator: calling ``func`` returns its :class:`Job` (see :func:`run_in_background`).
+
+    ``tables`` names the store tables ``func`` reads, as for ``disk_cache``;
+    by default those declared by a cache decorator underneath are used.
+    """
+    if func is None:
+        return functools.partial(background, tables=tables)
+    if tables is None:
+        tables = getattr(func, "tables", None)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs) -> Job:
+        return _submit(func, tables, args, kwargs)
+
+    wrapper.tables = tables
+    return wrapper
+
+
+def _fraction(jobs) -> float:
+    return sum(1.0 if job.done() else getattr(job, "fraction", 0.0) for job in jobs) / max(len(jobs), 1)
+
+
+def wait_for(jobs, text: str):
+    """Results of ``jobs`` (a job or future, or a dict of them), None while one runs.
+
+    Meanwhile, a progress bar that refreshes itself holds their place on the
+    page, and the page reruns with the results as soon as they are ready.
+    The script is not stopped: pages draw what depends on the results only
+    when they are not None, so the rest of the page is there from the start.
+    """
+    # Local import: report_progress is also called from the ingest CLI
+    import streamlit as st
+
+    pending = list(jobs.values()) if isinstance(jobs, dict) else [jobs]
+    if not all(job.done() for job in pending):
+
+        @st.fragment(run_every=POLL_SECONDS)
+        def progress():
+            if all(job.done() for job in pending):
+                st.rerun()
+            messages = [job.message for job in pending if not job.done() and getattr(job, "message", "")]
+            st.progress(_fraction(pending), text=" — ".join([text] + messages[:1]))
+
+        progress()
+        return None
+    if isinstance(jobs, dict):
+        return {k: job.result() for k, job in jobs.items()}
+    return jobs.result()
@@ -0,0 +1,84 @@
+"""Incremental recomputation of the derived values of a page.
+
+Streamlit reruns a page script from the top on every widget change. A
+:class:`Graph` keeps the derived values of a page (dataset -> filtered
+rows -> figure) in the session between reruns, and recomputes a node only
+when one of its inputs changed since it was last computed. Wrapping the
+widgets and the chart in ``st.fragment`` then makes a slider rerun only
+that region, and only the nodes downstream of the slider.
+
+    graph = Graph("popular")
+    graph.input("recipes", load_aggregate("recipe_evaluations"), key=version)
+
+    @graph.node
+    def popular(recipes):
+        return recipes.nlargest(200, "n_evaluated")
+
+    popular()  # computed once, then read back until "recipes" changes
+
+The dependencies of a node are the names of its parameters.
+"""
+import inspect
+
+import streamlit as st
+
+from utils.logger import logger
+
+
+def _code_key(func) -> tuple:
+    """What identifies the code of ``func``: its bytecode alone leaves out
+    the literals (``co_consts``) and the global names it reads."""
+    code = func.__code__
+    return code.co_code, code.co_consts, code.co_names
+
+
+class Graph:
+    """Named inputs and derived nodes, memoised in ``st.session_state``."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._nodes = {}
+        self._state = st.session_state.setdefault(f"graph:{name}", {"inputs": {}, "nodes": {}})
+
+    def input(self, name: str, value, key=None):
+        """Set input ``name`` to ``value`` and return it.
+
+        Nodes depending on it recompute when ``key`` (the value itself by
+        default, so it must then be comparable with ``==``) changes.
+        """
+        key = value if key is None else key
+        inputs = self._state["inputs"]
+        previous = inputs.get(name)
+        if previous is None or previous["key"] != key:
+            version = 0 if previous is None else previous["version"] + 1
+            inputs[name] = {"key": key, "value": value, "version": version}
+        return value
+
+    def node(self, func):
+        """Register ``func`` as a node; calling the result returns its current value."""
+        self._nodes[func.__name__] = (func, list(inspect.signature(func).parameters))
+        return lambda: self[func.__name__]
+
+    def _evaluate(self, name: str) -> dict:
+        if name not in self._nodes:
+            if name not in self._state["inputs"]:
+                raise KeyError(f"{name!r} is neither an input nor a node of graph {self.name!r}")
+            return self._state["inputs"][name]
+        func, deps = self._nodes[name]
+        upstream = {dep: self._evaluate(dep) for dep in deps}
+        versions = {dep: entry["version"] for dep, entry in upstream.items()}
+        entry = self._state["nodes"].get(name)
+        # The page is re-executed on every full rerun: an edited node recomputes too
+        if entry is None or entry["deps"] != versions or entry["code"] != _code_key(func):
+            logger.debug("graph %s: recomputing %s", self.name, name)
+            entry = {
+                "value": func(*(upstream[dep]["value"] for dep in deps)),
+                "deps": versions,
+                "code": _code_key(func),
+                "version": 0 if entry is None else entry["version"] + 1,
+            }
+            self._state["nodes"][name] = entry
+        return entry
+
+    def __getitem__(self, name: str):
+        return self._evaluate(name)["value"]
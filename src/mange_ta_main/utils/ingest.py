@@ -0,0 +1,339 @@
+"""Chunked, bounded-memory ingestion of the raw CSVs into the store.
+
+Each CSV is parsed, normalised and appended to Parquet partitions (one per
+year of the table's date column) one chunk at a time, so at most one chunk
+(and its normalised copy) is held in memory. The chunk size adapts to the
+measured cost of a row so that the working set stays under
+``memory_limit_mb``.
+
+Numeric columns are appended to their memory-mapped column files, and the
+encoded list columns to their offsets/codes files, in the same pass.
+
+Ingestion is incremental: the manifest remembers how many bytes of each
+source CSV were consumed, and a later run only parses what was appended
+since, writing it as new partitions. A rebuild writes a new generation of
+the table in its own directory and only deletes the previous one once the
+manifest points at the new files.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.store import (
+    ENCODED_LISTS,
+    MAPPED_COLUMNS,
+    RAW_STRING_COLUMNS,
+    ROW_ID,
+    STORE_DIR,
+    column_path,
+    file_sha256,
+    list_paths,
+    load_manifest,
+    normalize,
+    partition_file,
+    partition_key,
+    partition_schema,
+    save_manifest,
+    schema_fingerprint,
+    table_dir,
+    table_entry,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_MEMORY_LIMIT_MB = 256
+FIRST_CHUNK_ROWS = 10_000
+MIN_CHUNK_ROWS = 1_000
+# Raw chunk + normalised frame + Arrow table are alive at the same time
+CHUNK_OVERHEAD = 3
+# Bytes just before the consumed offset used to check that a source CSV
+# was appended to rather than rewritten
+FINGERPRINT_BYTES = 64 * 1024
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of the current process, in MB."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def next_chunk_rows(chunk: pd.DataFrame, memory_limit_mb: float) -> int:
+    """Number of rows whose processing fits in ``memory_limit_mb``."""
+    bytes_per_row = chunk.memory_usage(deep=True).sum() / max(len(chunk), 1)
+    budget = memory_limit_mb * 1024 * 1024 / CHUNK_OVERHEAD
+    return max(MIN_CHUNK_ROWS, int(budget / max(bytes_per_row, 1)))
+
+
+def source_fingerprint(csv_path, offset: int) -> str:
+    """Hash of the ``FINGERPRINT_BYTES`` preceding ``offset`` in ``csv_path``."""
+    with open(csv_path, "rb") as f:
+        f.seek(max(0, offset - FINGERPRINT_BYTES))
+        return hashlib.sha256(f.read(offset - f.tell())).hexdigest()
+
+
+def _open_column_files(stack: ExitStack, name: str, entry: dict, committed_rows: int) -> dict:
+    """Open the column files of ``name`` for appending after ``committed_rows``.
+
+    Files are truncated first, dropping whatever an interrupted ingest may
+    have written past the last committed row.
+    """
+    files = {}
+    for col, dtype in MAPPED_COLUMNS[name].items():
+        path = column_path(name, col, entry)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        f = stack.enter_context(open(path, "r+b" if path.exists() else "wb"))
+        f.truncate(committed_rows * dtype.itemsize)
+        f.seek(0, os.SEEK_END)
+        files[col] = f
+    return files
+
+
+def _open_list_files(stack: ExitStack, name: str, entry: dict, committed_rows: int) -> dict:
+    """Open the offsets/codes files of each encoded list column of ``name``."""
+    states = {}
+    for col in ENCODED_LISTS[name]:
+        paths = list_paths(name, col, entry)
+        paths["offsets"].parent.mkdir(parents=True, exist_ok=True)
+        offsets = stack.enter_context(open(paths["offsets"], "r+b" if paths["offsets"].exists() else "w+b"))
+        # rows + 1 entries: a new file is extended with the leading 0 offset
+        offsets.truncate((committed_rows + 1) * 8)
+        offsets.seek(committed_rows * 8)
+        base = int(np.frombuffer(offsets.read(8), dtype=np.int64)[0])
+        codes = stack.enter_context(open(paths["codes"], "r+b" if paths["codes"].exists() else "wb"))
+        codes.truncate(base * 4)
+        codes.seek(0, os.SEEK_END)
+        vocab = json.loads(paths["vocab"].read_text()) if paths["vocab"].exists() else []
+        states[col] = {"offsets": offsets, "codes": codes, "base": base, "vocab": vocab}
+    return states
+
+
+def _append_lists(state: dict, lists: pd.Series) -> None:
+    """Encode ``lists`` against the (growing) vocabulary and append it."""
+    lengths = lists.map(len).to_numpy(dtype=np.int64)
+    flat = pd.Index([token for row in lists for token in row], dtype=object)
+    codes = pd.Index(state["vocab"], dtype=object).get_indexer(flat)
+    new_tokens = flat[codes < 0].unique()
+    if len(new_tokens):
+        state["vocab"].extend(new_tokens)
+        codes = pd.Index(state["vocab"], dtype=object).get_indexer(flat)
+    codes.astype(np.int32).tofile(state["codes"])
+    (state["base"] + np.cumsum(lengths)).tofile(state["offsets"])
+    state["base"] += int(lengths.sum())
+
+
+def _write_partitions(reader, name: str, entry: dict, memory_limit_mb: float) -> dict:
+    """Drain ``reader`` chunk by chunk into new partitions of ``name``.
+
+    Each chunk is split by year; every year met gets its own partition file
+    (``year=YYYY/part-<index>.parquet``), kept open until the reader is done.
+    Files go to the directory of ``entry``, after its committed rows.
+    """
+    index = len(entry["partitions"])
+    committed_rows = entry.get("rows", 0)
+    schema = partition_schema(name)
+    key = partition_key(name)
+    writers = {}
+
+    rows = 0
+    chunks = 0
+    chunk_rows = FIRST_CHUNK_ROWS
+    with ExitStack() as stack:
+        stack.enter_context(reader)
+        column_files = _open_column_files(stack, name, entry, committed_rows)
+        list_states = _open_list_files(stack, name, entry, committed_rows)
+        while True:
+            try:
+                chunk = reader.get_chunk(chunk_rows)
+            except StopIteration:
+                break
+            frame = normalize(chunk, name)
+            frame[ROW_ID] = np.arange(committed_rows + rows, committed_rows + rows + len(frame))
+            table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+            years = frame[key].to_numpy()
+            for year in np.unique(years).tolist():
+                if year not in writers:
+                    path = table_dir(name, entry) / partition_file(index, year)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp_path = path.with_suffix(".parquet.tmp")
+                    writer = stack.enter_context(pq.ParquetWriter(tmp_path, schema))
+                    writers[year] = {"writer": writer, "path": path, "tmp_path": tmp_path, "rows": 0}
+                in_year = years == year
+                writers[year]["writer"].write_table(table.filter(pa.array(in_year)))
+                writers[year]["rows"] += int(in_year.sum())
+            for col, f in column_files.items():
+                frame[col].to_numpy(dtype=MAPPED_COLUMNS[name][col]).tofile(f)
+            for col, state in list_states.items():
+                _append_lists(state, frame[col])
+            rows += len(chunk)
+            chunks += 1
+            chunk_rows = next_chunk_rows(chunk, memory_limit_mb)
+            del chunk, frame, table
+    for state in writers.values():
+        os.replace(state["tmp_path"], state["path"])
+    for col, state in list_states.items():
+        _save_vocab(list_paths(name, col, entry)["vocab"], state["vocab"])
+
+    created = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    return {
+        "partitions": [
+            {
+                "file": state["path"].relative_to(table_dir(name, entry)).as_posix(),
+                "year": year,
+                "rows": state["rows"],
+                "sha256": file_sha256(state["path"]),
+                "created": created,
+            }
+            for year, state in sorted(writers.items())
+        ],
+        "rows": rows,
+        "chunks": chunks,
+    }
+
+
+def _save_vocab(path, vocab: list[str]) -> None:
+    # Codes are append-only: existing tokens keep their code across refreshes
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(vocab))
+    os.replace(tmp_path, path)
+
+
+def _read_csv(source, name: str, **kwargs):
+    return pd.read_csv(
+        source,
+        dtype={col: str for col in RAW_STRING_COLUMNS[name]},
+        chunksize=FIRST_CHUNK_ROWS,
+        **kwargs,
+    )
+
+
+def ingest_csv(
+    csv_path,
+    name: str,
+    memory_limit_mb: float = DEFAULT_MEMORY_LIMIT_MB,
+    append: bool = False,
+) -> dict:
+    """Stream ``csv_path`` into the ``name`` table of the store.
+
+    By default the table is rebuilt from scratch. With ``append=True``,
+    ``csv_path`` is a delta file (with header) added as new partitions.
+    """
+    start = time.perf_counter()
+    manifest = load_manifest()
+    entry = table_entry(name, manifest)
+
+    if append and entry is not None:
+        if entry.get("schema") != schema_fingerprint(name):
+            raise ValueError(f"The layout of {name!r} changed since it was stored, run init_data --rebuild first")
+        written = _write_partitions(_read_csv(csv_path, name), name, entry, memory_limit_mb)
+        return _commit(manifest, name, entry, written, start)
+
+    # Readers keep using the previous generation until the manifest is saved
+    size = os.path.getsize(csv_path)
+    new_entry = {
+        "dir": f"{name}.{time.time_ns():x}",
+        "source": {
+            "path": str(csv_path),
+            "columns": list(pd.read_csv(csv_path, nrows=0).columns),
+            "bytes": size,
+            "fingerprint": source_fingerprint(csv_path, size),
+        },
+        "partitions": [],
+    }
+    written = _write_partitions(_read_csv(csv_path, name), name, new_entry, memory_limit_mb)
+    stats = _commit(manifest, name, new_entry, written, start)
+    _remove_generations(name, keep=new_entry["dir"])
+    return stats
+
+
+def sync_csv(csv_path, name: str, memory_limit_mb: float = DEFAULT_MEMORY_LIMIT_MB) -> dict:
+    """Bring ``name`` up to date with ``csv_path``, parsing only appended rows.
+
+    Falls back to a full rebuild when the table is missing, was stored
+    with another layout, or the source no longer starts with the bytes
+    that were previously ingested.
+    """
+    start = time.perf_counter()
+    manifest = load_manifest()
+    entry = table_entry(name, manifest)
+    size = os.path.getsize(csv_path)
+
+    source = entry["source"] if entry is not None else None
+    if (
+        source is None
+        or entry.get("schema") != schema_fingerprint(name)
+        or source["path"] != str(csv_path)
+        or size < source["bytes"]
+        or source_fingerprint(csv_path, source["bytes"]) != source["fingerprint"]
+    ):
+        return ingest_csv(csv_path, name, memory_limit_mb)
+    if size == source["bytes"]:
+        return _stats(name, None, start)
+
+    with open(csv_path, "rb") as f:
+        f.seek(source["bytes"])
+        reader = _read_csv(f, name, header=None, names=source["columns"])
+        written = _write_partitions(reader, name, entry, memory_limit_mb)
+    source["bytes"] = size
+    source["fingerprint"] = source_fingerprint(csv_path, size)
+    return _commit(manifest, name, entry, written, start)
+
+
+def _commit(manifest: dict, name: str, entry: dict, written: dict, start: float) -> dict:
+    entry["partitions"].extend(written["partitions"])
+    entry["rows"] = sum(p["rows"] for p in entry["partitions"])
+    entry["schema"] = schema_fingerprint(name)
+    manifest["tables"][name] = entry
+    save_manifest(manifest)
+    return _stats(name, written, start)
+
+
+def _remove_generations(name: str, keep: str) -> None:
+    """Delete every directory of ``name`` but the committed one, ``keep``.
+
+    Also clears generations left behind by an interrupted rebuild, and the
+    directory of stores written before tables had generations.
+    """
+    for path in [STORE_DIR / name, *STORE_DIR.glob(f"{name}.*")]:
+        if path.name != keep and path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _stats(name: str, written: dict | None, start: float) -> dict:
+    elapsed = time.perf_counter() - start
+    rows = written["rows"] if written else 0
+    return {
+        "table": name,
+        "partitions": [p["file"] for p in written["partitions"]] if written else [],
+        "years": [p["year"] for p in written["partitions"]] if written else [],
+        "rows": rows,
+        "chunks": written["chunks"] if written else 0,
+        "seconds": elapsed,
+        "rows_per_sec": rows / elapsed if elapsed > 0 else float("nan"),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def format_stats(stats: dict) -> str:
+    if not stats["partitions"]:
+        return f"{stats['table']}: up to date"
+    peak = stats["peak_rss_mb"]
+    years = stats["years"]
+    return (
+        f"{stats['table']}: {stats['rows']:,} rows in {len(stats['partitions'])} partitions "
+        f"(years {years[0]}-{years[-1]}), {stats['chunks']} chunks, {stats['seconds']:.1f}s "
+        f"({stats['rows_per_sec']:,.0f} rows/s), "
+        f"peak RSS {'n/a' if peak is None else f'{peak:.0f} MB'}"
+    )
@@ -0,0 +1,192 @@
+"""In-process, size-bounded cache for parameter-driven results.
+
+``st.cache_data`` and ``st.cache_resource`` keep an entry for every
+combination of arguments until the process exits, so each new slider
+position or selection grows the process for good. :func:`memory_cache`
+measures the size of every entry instead and keeps the total of all
+decorated functions under one budget, evicting the least recently
+(``"lru"``) or least frequently (``"lfu"``) used entries first. Keys are
+built like those of ``utils/disk_cache.py``: a new dataset or an edited
+function never serves a stale result.
+
+Hits, misses and evictions are counted per function, see
+:func:`memory_cache_stats`.
+"""
+import functools
+import mmap
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+from utils.disk_cache import cache_key, source_hash
+
+DEFAULT_MAX_MB = float(os.environ.get("MANGE_TA_MAIN_MEMORY_CACHE_MB", 512))
+DEFAULT_POLICY = os.environ.get("MANGE_TA_MAIN_MEMORY_CACHE_POLICY", "lru")
+POLICIES = ("lru", "lfu")
+
+_MISS = object()
+
+
+def _file_backed(array: np.ndarray) -> bool:
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def nbytes(value) -> tuple[int, bool]:
+    """``(size, final)``: approximate bytes held by ``value``.
+
+    Arrays and frames count their buffers (object columns deeply),
+    containers and plain objects their items and attributes, each object
+    once. Memory-mapped arrays count nothing: their pages belong to the
+    file. ``final`` is False while a :class:`Future` in ``value`` is
+    pending, as its result is not counted yet.
+    """
+    seen = set()
+    final = True
+
+    def measure(obj) -> int:
+        nonlocal final
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        if isinstance(obj, np.ndarray):
+            if _file_backed(obj):
+                return 0
+            if obj.dtype == object:
+                return obj.nbytes + sum(measure(item) for item in obj.ravel())
+            return obj.nbytes
+        if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+            usage = obj.memory_usage(deep=True)
+            return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+        if isinstance(obj, Future):
+            if not obj.done():
+                final = False
+                return sys.getsizeof(obj)
+            return sys.getsizeof(obj) + (measure(obj.result()) if obj.exception() is None else 0)
+        if hasattr(obj, "to_plotly_json"):  # Plotly figures and traces
+            return measure(obj.to_plotly_json())
+        size = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            size += sum(measure(k) + measure(v) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            size += sum(measure(item) for item in obj)
+        elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+            size += measure(vars(obj))
+        return size
+
+    return measure(value), final
+
+
+class MemoryCache:
+    """Entries of all decorated functions under one byte budget."""
+
+    def __init__(self, max_mb: float = DEFAULT_MAX_MB, policy: str = DEFAULT_POLICY):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown eviction policy {policy!r}, expected one of {POLICIES}")
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.policy = policy
+        self.bytes = 0
+        # key -> entry, from least to most recently used
+        self._entries = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _counters(self, name: str) -> dict:
+        return self._stats.setdefault(name, {"hits": 0, "misses": 0, "evictions": 0})
+
+    def get(self, name: str, key: str, default=_MISS):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters(name)["misses"] += 1
+                return default
+            self._counters(name)["hits"] += 1
+            entry["uses"] += 1
+            self._entries.move_to_end(key)
+            if not entry["final"]:
+                # A pending result has landed since: count it now
+                size, entry["final"] = nbytes(entry["value"])
+                self.bytes += size - entry["bytes"]
+                entry["bytes"] = size
+                self._evict()
+            return entry["value"]
+
+    def put(self, name: str, key: str, value) -> None:
+        size, final = nbytes(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old["bytes"]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = {"name": name, "value": value, "bytes": size, "final": final, "uses": 1}
+            self.bytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes and self._entries:
+            if self.policy == "lru":
+                key = next(iter(self._entries))
+            else:
+                # Least used first, the least recent among equals
+                key = min(self._entries, key=lambda k: self._entries[k]["uses"])
+            entry = self._entries.pop(key)
+            self.bytes -= entry["bytes"]
+            self._counters(entry["name"])["evictions"] += 1
+
+    def clear(self, name: str | None = None) -> None:
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if name is None or e["name"] == name]:
+                self.bytes -= self._entries.pop(key)["bytes"]
+
+    def stats(self) -> pd.DataFrame:
+        """Hits, misses, evictions, entries and bytes per function."""
+        with self._lock:
+            rows = {name: dict(counters, entries=0, bytes=0) for name, counters in self._stats.items()}
+            for entry in self._entries.values():
+                row = rows[entry["name"]]
+                row["entries"] += 1
+                row["bytes"] += entry["bytes"]
+        columns = ["hits", "misses", "evictions", "entries", "bytes"]
+        return pd.DataFrame.from_dict(rows, orient="index", columns=columns).rename_axis("function")
+
+
+CACHE = MemoryCache()
+
+
+def memory_cache(func=None, *, cache: MemoryCache = CACHE, tables=None):
+    """Decorator keeping ``func``'s results in the size-bounded ``cache``.
+
+    Arguments and ``tables`` are hashed like for ``disk_cache``; the
+    returned value is shared between callers and must not be modified.
+    """
+    if func is None:
+        return functools.partial(memory_cache, cache=cache, tables=tables)
+    code_hash = source_hash(func)
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = cache_key(func, code_hash, args, kwargs, tables)
+        value = cache.get(name, key)
+        if value is _MISS:
+            value = func(*args, **kwargs)
+            cache.put(name, key, value)
+        return value
+
+    wrapper.clear = functools.partial(cache.clear, name)
+    wrapper.tables = tables
+    return wrapper
+
+
+def memory_cache_stats() -> pd.DataFrame:
+    """Counters of the shared in-memory cache, one row per function."""
+    return CACHE.stats()
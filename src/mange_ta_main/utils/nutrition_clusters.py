@@ -0,0 +1,259 @@
+"""Nutrition clusters of the recipes, fitted once and kept in the store.
+
+The nutrition columns are streamed from their memory-mapped files in
+batches of ``BATCH_ROWS``: the scaler, ``MiniBatchKMeans`` and
+``IncrementalPCA`` are all fitted with ``partial_fit``, and the trim
+quantiles are estimated on a fixed-size sample, so memory does not grow
+with the number of recipes. The fitted models and the label and 2D
+projection of every recipe are saved under ``MODEL_DIR``. Recipes appended
+to the store later are assigned to the existing clusters without refitting;
+the models are only refitted when their parameters change or the recipes
+table is rebuilt.
+
+Only ``init_data`` updates the artifact, under a file lock; the app reads it
+with :func:`read_nutrition_clusters`, which refuses a missing or stale one.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from contextlib import ExitStack
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from sklearn.preprocessing import StandardScaler
+
+from utils.disk_cache import file_lock
+from utils.executor import report_progress
+from utils.store import (
+    STORE_DIR,
+    load_manifest,
+    map_columns,
+    nutrition_categories,
+    require_table,
+    save_manifest,
+    table_entry,
+)
+from utils.trimming import quantile_bounds, within_bounds
+
+NAME = "nutrition_clusters"
+MODEL_DIR = STORE_DIR / "models" / NAME
+MODEL_PATH = MODEL_DIR / "model.pkl"
+LABELS_PATH = MODEL_DIR / "labels.bin"
+PCS_PATH = MODEL_DIR / "pcs.bin"
+LOCK_PATH = MODEL_DIR / "update.lock"
+
+BATCH_ROWS = 65_536
+# Rows per MiniBatchKMeans step, and passes over the recipes
+MINI_BATCH_ROWS = 4_096
+EPOCHS = 3
+
+PARAMS = {
+    "features": nutrition_categories,
+    "n_clusters": 5,
+    "n_components": 2,
+    # Recipes outside these quantiles of any feature are left out of the fit,
+    # the quantiles being estimated on a random sample of that many recipes
+    "trim_quantiles": [0.01, 0.99],
+    "trim_sample_rows": 200_000,
+    "random_state": 42,
+}
+
+
+def _batches(start: int, stop: int, size: int):
+    for lo in range(start, stop, size):
+        yield slice(lo, min(lo + size, stop))
+
+
+def _features(columns: dict, rows: slice) -> np.ndarray:
+    X = np.column_stack([columns[col][rows] for col in PARAMS["features"]]).astype(np.float64)
+    return np.nan_to_num(X, nan=0.0)
+
+
+def _fit(columns: dict, n_rows: int) -> dict:
+    """Fit scaler, k-means and PCA on the recipes within the trim quantiles.
+
+    The recipes are stored in year order: batches are visited in a new
+    random order on each pass, and shuffled, so that k-means steps do not
+    follow the drift of the recipes over time.
+    """
+    rng = np.random.default_rng(PARAMS["random_state"])
+    # Sorted, so that the sample is read from the memory maps front to back
+    sample = np.sort(rng.choice(n_rows, min(n_rows, PARAMS["trim_sample_rows"]), replace=False))
+    bounds = quantile_bounds(
+        pd.DataFrame({col: values[sample] for col, values in columns.items()}),
+        *PARAMS["trim_quantiles"],
+    )
+
+    def kept(rows):
+        X = _features(columns, rows)
+        return X[within_bounds(pd.DataFrame(X, columns=PARAMS["features"]), bounds)]
+
+    scaler = StandardScaler()
+    for rows in _batches(0, n_rows, BATCH_ROWS):
+        report_progress(rows.start / n_rows / (EPOCHS + 1), "Scaling the nutrition features")
+        scaler.partial_fit(kept(rows))
+
+    kmeans = MiniBatchKMeans(n_clusters=PARAMS["n_clusters"], random_state=PARAMS["random_state"], n_init=3)
+    pca = IncrementalPCA(n_components=PARAMS["n_components"])
+    n_fitted = 0
+    batches = list(_batches(0, n_rows, BATCH_ROWS))
+    for epoch in range(EPOCHS):
+        for i, batch in enumerate(rng.permutation(len(batches))):
+            report_progress(
+                (epoch + 1 + i / len(batches)) / (EPOCHS + 1),
+                f"Fitting the clusters (pass {epoch + 1}/{EPOCHS})",
+            )
+            X = scaler.transform(kept(batches[batch]))
+            X = X[rng.permutation(len(X))]
+            if epoch == 0:
+                n_fitted += len(X)
+                if len(X) >= PARAMS["n_components"]:
+                    pca.partial_fit(X)
+            for step in _batches(0, len(X), MINI_BATCH_ROWS):
+                # The first step initialises the centroids: it needs enough rows
+                if hasattr(kmeans, "cluster_centers_") or step.stop - step.start >= PARAMS["n_clusters"]:
+                    kmeans.partial_fit(X[step])
+
+    # Number clusters by increasing calories, so ids are stable across refits
+    order = np.argsort(kmeans.cluster_centers_[:, 0])
+    relabel = np.empty_like(order)
+    relabel[order] = np.arange(len(order))
+    return {"scaler": scaler, "kmeans": kmeans, "pca": pca, "relabel": relabel, "bounds": bounds, "rows": n_fitted}
+
+
+def _assign(model: dict, columns: dict, start: int, stop: int, labels_file, pcs_file) -> None:
+    for rows in _batches(start, stop, BATCH_ROWS):
+        X = model["scaler"].transform(_features(columns, rows))
+        model["relabel"][model["kmeans"].predict(X)].astype(np.int8).tofile(labels_file)
+        model["pca"].transform(X).astype(np.float32).tofile(pcs_file)
+
+
+def _tmp_path(path):
+    return path.with_suffix(path.suffix + ".tmp")
+
+
+def _open_replacement(stack: ExitStack, path, size: int):
+    """Temporary copy of the first ``size`` bytes of ``path``, open for appending.
+
+    The app memory-maps ``path``: it is never written in place, the copy is
+    moved over it once complete.
+    """
+    tmp_path = _tmp_path(path)
+    if size:
+        shutil.copyfile(path, tmp_path)
+    f = stack.enter_context(open(tmp_path, "r+b" if size else "wb"))
+    f.truncate(size)
+    f.seek(0, os.SEEK_END)
+    return f
+
+
+def _save_model(model: dict) -> None:
+    MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = MODEL_PATH.with_suffix(".pkl.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, MODEL_PATH)
+
+
+def update_nutrition_clusters(force: bool = False) -> dict:
+    """Bring the clusters up to date with the recipes table.
+
+    Refits when forced, when ``PARAMS`` changed or when the partitions the
+    models were fitted on are gone; otherwise only the recipes added since
+    the last update are assigned. Returns ``{"refitted": bool, "assigned": n}``.
+    Concurrent updates (several ``init_data`` runs) are serialised by a lock.
+    """
+    with file_lock(LOCK_PATH):
+        return _update(force)
+
+
+def _update(force: bool) -> dict:
+    manifest = load_manifest()
+    recipes = require_table("recipes", manifest)
+    partitions = [p["sha256"] for p in recipes["partitions"]]
+    entry = manifest.get("models", {}).get(NAME)
+
+    refit = (
+        force
+        or entry is None
+        or entry["params"] != PARAMS
+        or partitions[:len(entry["partitions"])] != entry["partitions"]
+        or not MODEL_PATH.exists()
+        or not LABELS_PATH.exists()
+        or not PCS_PATH.exists()
+    )
+    committed = 0 if refit else entry["rows"]
+    if not refit and committed == recipes["rows"]:
+        return {"refitted": False, "assigned": 0}
+
+    columns = {
+        col: values.to_numpy()
+        for col, values in map_columns("recipes", PARAMS["features"], manifest).items()
+    }
+    if refit:
+        model = _fit(columns, recipes["rows"])
+        _save_model(model)
+    else:
+        with open(MODEL_PATH, "rb") as f:
+            model = pickle.load(f)
+
+    MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    with ExitStack() as stack:
+        # Whatever an interrupted update wrote past the committed rows is dropped
+        labels_file = _open_replacement(stack, LABELS_PATH, committed)
+        pcs_file = _open_replacement(stack, PCS_PATH, committed * PARAMS["n_components"] * 4)
+        _assign(model, columns, committed, recipes["rows"], labels_file, pcs_file)
+    # Processes that mapped the previous files keep reading them, unchanged
+    for path in (LABELS_PATH, PCS_PATH):
+        os.replace(_tmp_path(path), path)
+
+    fitted_on = entry["fitted_on"] if not refit else hashlib.sha256("".join(partitions).encode()).hexdigest()[:16]
+    manifest.setdefault("models", {})[NAME] = {
+        "params": PARAMS,
+        "fitted_on": fitted_on,
+        "fitted_rows": model["rows"],
+        "version": hashlib.sha256(json.dumps([PARAMS, fitted_on]).encode()).hexdigest()[:16],
+        "partitions": partitions,
+        "rows": recipes["rows"],
+    }
+    save_manifest(manifest)
+    return {"refitted": refit, "assigned": recipes["rows"] - committed}
+
+
+def is_current(manifest: dict | None = None) -> bool:
+    """Whether the artifact covers exactly the recipes table, with ``PARAMS``."""
+    manifest = load_manifest() if manifest is None else manifest
+    recipes = table_entry("recipes", manifest)
+    entry = manifest.get("models", {}).get(NAME)
+    return (
+        recipes is not None
+        and entry is not None
+        and entry["params"] == PARAMS
+        and entry["partitions"] == [p["sha256"] for p in recipes["partitions"]]
+        and entry["rows"] == recipes["rows"]
+        and LABELS_PATH.exists()
+        and PCS_PATH.exists()
+    )
+
+
+def read_nutrition_clusters(manifest: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Read-only ``(labels, pcs)`` of the recipes, aligned with the store rows.
+
+    Never updates the artifact: raises if it is missing or stale.
+    """
+    manifest = load_manifest() if manifest is None else manifest
+    if not is_current(manifest):
+        raise FileNotFoundError(
+            f"The nutrition clusters in {MODEL_DIR} are missing or out of date with the recipes table, "
+            "run init_data first"
+        )
+    rows = manifest["models"][NAME]["rows"]
+    if not rows:
+        return np.empty(0, dtype=np.int8), np.empty((0, PARAMS["n_components"]), dtype=np.float32)
+    labels = np.memmap(LABELS_PATH, dtype=np.int8, mode="r", shape=(rows,))
+    pcs = np.memmap(PCS_PATH, dtype=np.float32, mode="r", shape=(rows, PARAMS["n_components"]))
+    return labels, pcs
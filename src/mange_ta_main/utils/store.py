@@ -0,0 +1,523 @@
+"""Typed columnar store for the Food.com tables.
+
+The raw Kaggle CSVs are normalised once by ``Data/raw/import_data.py`` and
+written as Parquet files. The application then reads only the columns it
+needs, without unpickling whole frames or re-parsing strings.
+
+Each table is a directory of append-only partitions listed in
+``manifest.json`` with their year, row counts and content hashes. Rows are
+split by the year of the table's date column
+(``year=YYYY/part-NNNNN.parquet``), so a date-range read only opens the
+partitions of the years it covers. New rows land in new partitions, so a
+refresh never rewrites existing files.
+
+Numeric and timestamp columns are also kept as raw, headerless arrays
+(``columns/<column>.bin``) spanning all partitions. They are opened with
+``np.memmap`` read-only, so every Streamlit process maps the same pages of
+the OS page cache instead of holding a private copy.
+
+The Python-literal list columns (``tags``, ``ingredients``, ``steps``) are
+parsed once at ingest into native Parquet list columns. ``tags`` and
+``ingredients`` are additionally dictionary-encoded into memory-mapped
+offsets and integer codes with a shared vocabulary (``lists/<column>.*``),
+see :class:`EncodedList`. Timestamp columns come with integer year, month
+index and weekday columns computed at ingest. The same arrays are a CSR ``rows × vocab``
+incidence matrix, so counting tokens per group of rows is a sparse product.
+"""
+import ast
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy import sparse
+
+DATA_DIR = Path("Data")
+STORE_DIR = DATA_DIR / "store"
+MANIFEST_PATH = STORE_DIR / "manifest.json"
+
+nutrition_categories = [
+    "Calories",
+    "Total fat",
+    "Sugar",
+    "Sodium",
+    "Protein",
+    "Saturated fat",
+    "Carbohydrates",
+]
+
+# Integer parts of each timestamp column, derived once at ingest so pages
+# never parse or decompose dates. Missing timestamps give -1 (test the year:
+# a month index is also negative before 1970).
+DATE_PARTS = {
+    "year": pa.int16(),
+    "month": pa.int32(),  # months since 1970-01 (calendar month: % 12 + 1)
+    "weekday": pa.int8(),  # Monday = 0
+}
+
+
+def date_part_fields(column: str) -> list[tuple[str, pa.DataType]]:
+    return [(f"{column}_{part}", dtype) for part, dtype in DATE_PARTS.items()]
+
+
+RECIPES_SCHEMA = pa.schema(
+    [
+        ("name", pa.string()),
+        ("id", pa.int32()),
+        ("minutes", pa.int32()),
+        ("contributor_id", pa.int32()),
+        ("submitted", pa.timestamp("ns")),
+        *date_part_fields("submitted"),
+        ("tags", pa.list_(pa.string())),
+        ("n_steps", pa.int16()),
+        ("steps", pa.list_(pa.string())),
+        ("description", pa.string()),
+        ("ingredients", pa.list_(pa.string())),
+        ("n_ingredients", pa.int16()),
+    ]
+    + [(name, pa.float32()) for name in nutrition_categories]
+)
+
+INTERACTIONS_SCHEMA = pa.schema(
+    [
+        ("user_id", pa.int32()),
+        ("recipe_id", pa.int32()),
+        ("date", pa.timestamp("ns")),
+        *date_part_fields("date"),
+        ("rating", pa.int8()),
+        ("review", pa.string()),
+    ]
+)
+
+SCHEMAS = {
+    "recipes": RECIPES_SCHEMA,
+    "interactions": INTERACTIONS_SCHEMA,
+}
+
+# Columns mirrored as memory-mapped arrays, with their NumPy dtypes
+MAPPED_COLUMNS = {
+    name: {
+        field.name: np.dtype(
+            "datetime64[ns]" if pa.types.is_timestamp(field.type) else field.type.to_pandas_dtype()
+        )
+        for field in schema
+        if pa.types.is_integer(field.type)
+        or pa.types.is_floating(field.type)
+        or pa.types.is_timestamp(field.type)
+    }
+    for name, schema in SCHEMAS.items()
+}
+
+# Partitions are split by the year of this timestamp column
+PARTITION_BY = {
+    "recipes": "submitted",
+    "interactions": "date",
+}
+# Store row number of each Parquet row, restoring the store order on read
+ROW_ID = "row_id"
+
+# List columns also stored as offsets + dictionary codes
+ENCODED_LISTS = {
+    "recipes": ["tags", "ingredients"],
+    "interactions": [],
+}
+LIST_COLUMNS = {
+    name: [field.name for field in schema if pa.types.is_list(field.type)]
+    for name, schema in SCHEMAS.items()
+}
+
+# Columns read as plain strings from the raw CSVs, before normalisation
+RAW_STRING_COLUMNS = {
+    "recipes": ["name", "submitted", "tags", "nutrition", "steps", "description", "ingredients"],
+    "interactions": ["date", "review"],
+}
+
+
+def table_dir(name: str, entry: dict | None = None) -> Path:
+    """Directory of the committed generation of ``name`` (see ``ingest_csv``).
+
+    Stores written before tables had generations use ``STORE_DIR / name``.
+    """
+    entry = table_entry(name) if entry is None else entry
+    return STORE_DIR / (entry or {}).get("dir", name)
+
+
+def partition_key(name: str) -> str:
+    """Integer year column the partitions of ``name`` are split by."""
+    return f"{PARTITION_BY[name]}_year"
+
+
+def partition_schema(name: str) -> pa.Schema:
+    return SCHEMAS[name].append(pa.field(ROW_ID, pa.int64()))
+
+
+def partition_file(index: int, year: int) -> str:
+    # Missing dates land in year=-1
+    return f"year={year}/part-{index:05d}.parquet"
+
+
+def column_path(name: str, column: str, entry: dict | None = None) -> Path:
+    return table_dir(name, entry) / "columns" / f"{column}.bin"
+
+
+def list_paths(name: str, column: str, entry: dict | None = None) -> dict[str, Path]:
+    folder = table_dir(name, entry) / "lists"
+    return {
+        "offsets": folder / f"{column}.offsets.bin",
+        "codes": folder / f"{column}.codes.bin",
+        "vocab": folder / f"{column}.vocab.json",
+    }
+
+
+def parse_list_literal(value) -> list[str]:
+    """``"['a', 'b']"`` -> ``['a', 'b']``; missing values become ``[]``."""
+    if not isinstance(value, str):
+        return []
+    return [str(item) for item in ast.literal_eval(value)]
+
+
+def add_date_parts(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """Add the :data:`DATE_PARTS` columns of the datetime ``column`` of ``df``."""
+    timestamps = df[column].to_numpy(dtype="datetime64[ns]")
+    missing = np.isnat(timestamps)
+    months = timestamps.astype("datetime64[M]").astype(np.int64)
+    days = timestamps.astype("datetime64[D]").astype(np.int64)
+    parts = {
+        "year": months // 12 + 1970,
+        "month": months,
+        # 1970-01-01 was a Thursday
+        "weekday": (days + 3) % 7,
+    }
+    for part, values in parts.items():
+        df[f"{column}_{part}"] = np.where(missing, -1, values)
+    return df
+
+
+def normalize_recipes(df: pd.DataFrame) -> pd.DataFrame:
+    """Split the ``nutrition`` string and cast RAW_recipes to its store dtypes."""
+    nutrition_split = (
+        df["nutrition"]
+        .str.strip("[]")
+        .str.replace(" ", "", regex=False)
+        .str.split(",", expand=True)
+    )
+    nutrition_split.columns = nutrition_categories
+    nutrition_split = nutrition_split.astype("float32")
+
+    df = pd.concat([df.drop(columns=["nutrition"]), nutrition_split], axis=1)
+    df["submitted"] = pd.to_datetime(df["submitted"], errors="coerce")
+    add_date_parts(df, "submitted")
+    for col in LIST_COLUMNS["recipes"]:
+        df[col] = df[col].map(parse_list_literal)
+    return _cast(df, RECIPES_SCHEMA)
+
+
+def normalize_interactions(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast RAW_interactions to its store dtypes."""
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    add_date_parts(df, "date")
+    return _cast(df, INTERACTIONS_SCHEMA)
+
+
+def normalize(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    return NORMALIZERS[name](df)
+
+
+def _cast(df: pd.DataFrame, schema: pa.Schema) -> pd.DataFrame:
+    df = df[schema.names]
+    return df.astype(
+        {
+            field.name: field.type.to_pandas_dtype()
+            for field in schema
+            if pa.types.is_integer(field.type) or pa.types.is_floating(field.type)
+        }
+    )
+
+
+NORMALIZERS = {
+    "recipes": normalize_recipes,
+    "interactions": normalize_interactions,
+}
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest() -> dict:
+    if not MANIFEST_PATH.exists():
+        return {"tables": {}}
+    return json.loads(MANIFEST_PATH.read_text())
+
+
+def save_manifest(manifest: dict) -> None:
+    """Atomically replace the manifest, so readers never see a partial file."""
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, default=str))
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def schema_fingerprint(name: str) -> str:
+    """Hash of the layout of ``name``; a stored table with another one must be rebuilt."""
+    layout = [str(partition_schema(name)), ENCODED_LISTS[name], PARTITION_BY[name]]
+    return hashlib.sha256(json.dumps(layout).encode()).hexdigest()[:16]
+
+
+def table_entry(name: str, manifest: dict | None = None) -> dict | None:
+    manifest = load_manifest() if manifest is None else manifest
+    return manifest["tables"].get(name)
+
+
+def require_table(name: str, manifest: dict | None = None) -> dict:
+    """Manifest entry of ``name``; raises if the table was never ingested."""
+    entry = table_entry(name, manifest)
+    if entry is None:
+        raise FileNotFoundError(f"Table {name!r} is missing from {MANIFEST_PATH}, run init_data first")
+    return entry
+
+
+def partition_paths(name: str, manifest: dict | None = None, years: tuple[int, int] | None = None) -> list[Path]:
+    """Partition files of ``name``, only those of ``years`` (inclusive) when given."""
+    entry = table_entry(name, manifest)
+    if entry is None:
+        return []
+    return [
+        table_dir(name, entry) / p["file"]
+        for p in entry["partitions"]
+        if years is None or years[0] <= p["year"] <= years[1]
+    ]
+
+
+def table_version(name: str, manifest: dict | None = None) -> str:
+    """Hash of the partition hashes of ``name``; changes whenever a partition does."""
+    entry = table_entry(name, manifest)
+    if entry is None:
+        return ""
+    return _combine(p["sha256"] for p in entry["partitions"])
+
+
+def dataset_version(manifest: dict | None = None) -> str:
+    """Hash identifying the whole store, for keying derived artefacts."""
+    manifest = load_manifest() if manifest is None else manifest
+    return _combine(table_version(name, manifest) for name in sorted(manifest["tables"]))
+
+
+def _combine(hashes) -> str:
+    return hashlib.sha256("".join(hashes).encode()).hexdigest()
+
+
+def read_table(
+    name: str,
+    columns: list[str] | None = None,
+    years: tuple[int, int] | None = None,
+    rows: np.ndarray | None = None,
+) -> pd.DataFrame:
+    """Read a table from the store, loading only ``columns`` when given.
+
+    With ``years``, only the partitions of those years (inclusive) are
+    read; with ``rows``, only those store rows are decoded. Rows come in
+    store order, indexed by their store row.
+    """
+    manifest = load_manifest()
+    require_table(name, manifest)
+    columns = SCHEMAS[name].names if columns is None else list(columns)
+    schema = partition_schema(name)
+    filters = None if rows is None else [(ROW_ID, "in", np.asarray(rows).tolist())]
+    tables = [
+        pq.read_table(path, columns=columns + [ROW_ID], filters=filters)
+        for path in partition_paths(name, manifest, years)
+    ]
+    table = pa.concat_tables(tables) if tables else schema.empty_table().select(columns + [ROW_ID])
+    # One ingest run writes to several partitions: restore the row order
+    df = table.sort_by(ROW_ID).to_pandas()
+    return df.set_index(ROW_ID).rename_axis(None)
+
+
+def partition_years(name: str, where: dict) -> tuple[int, int] | None:
+    """Years whose partitions can hold rows matching ``where``, None for all.
+
+    ``where`` maps columns to inclusive ``(low, high)`` bounds, ``None``
+    for an open side. Only bounds on the partition year or on the date it
+    is derived from narrow the years.
+    """
+    key = partition_key(name)
+    if key in where:
+        low, high = where[key]
+    elif PARTITION_BY[name] in where:
+        low, high = (None if b is None else pd.Timestamp(b).year for b in where[PARTITION_BY[name]])
+    else:
+        return None
+    # Open bounds keep the rows without a date (year -1)
+    return (-1 if low is None else int(low), 9999 if high is None else int(high))
+
+
+def select_rows(name: str, where: dict, manifest: dict | None = None) -> np.ndarray:
+    """Store rows of ``name`` whose columns lie within the bounds of ``where``.
+
+    Only memory-mapped (numeric and date) columns can be filtered on.
+    Missing dates and ``NaN`` never match; note that the derived date
+    parts hold -1 for a missing date.
+    """
+    unknown = [col for col in where if col not in MAPPED_COLUMNS[name]]
+    if unknown:
+        raise ValueError(f"Cannot filter {name!r} on {unknown}: only numeric and date columns can")
+    values = map_columns(name, list(where), manifest)
+    mask = np.ones(len(values), dtype=bool)
+    for col, (low, high) in where.items():
+        column = values[col].to_numpy()
+        if column.dtype.kind == "M":
+            mask &= ~np.isnat(column)
+        if low is not None:
+            mask &= column >= np.asarray(pd.Timestamp(low) if column.dtype.kind == "M" else low).astype(column.dtype)
+        if high is not None:
+            mask &= column <= np.asarray(pd.Timestamp(high) if column.dtype.kind == "M" else high).astype(column.dtype)
+    return np.flatnonzero(mask)
+
+
+def map_columns(name: str, columns: list[str] | None = None, manifest: dict | None = None) -> pd.DataFrame:
+    """Zero-copy, read-only frame over the memory-mapped columns of ``name``.
+
+    Only the ``rows`` recorded in the manifest are mapped, so bytes from an
+    append that has not been committed yet are never visible.
+    """
+    entry = require_table(name, manifest)
+    dtypes = MAPPED_COLUMNS[name]
+    columns = list(dtypes) if columns is None else columns
+    return pd.DataFrame(
+        {
+            col: np.memmap(column_path(name, col, entry), dtype=dtypes[col], mode="r", shape=(entry["rows"],))
+            if entry["rows"]
+            else np.empty(0, dtype=dtypes[col])
+            for col in columns
+        },
+        copy=False,
+    )
+
+
+class EncodedList:
+    """Dictionary-encoded list column.
+
+    Row ``i`` holds ``vocab[codes[offsets[i]:offsets[i + 1]]]``. All
+    operations are vectorised over ``codes``; no per-row string work.
+    """
+
+    def __init__(self, offsets: np.ndarray, codes: np.ndarray, vocab: np.ndarray):
+        self.offsets = offsets
+        self.codes = codes
+        self.vocab = vocab
+        self._index = None
+        self._incidence = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def row_ids(self) -> np.ndarray:
+        """Row of each entry of ``codes``."""
+        return np.repeat(np.arange(len(self)), self.lengths())
+
+    def codes_of(self, tokens) -> np.ndarray:
+        """Codes of the ``tokens`` present in the vocabulary."""
+        if self._index is None:
+            self._index = pd.Index(self.vocab)
+        codes = self._index.get_indexer(list(tokens))
+        return codes[codes >= 0]
+
+    def take(self, rows) -> "EncodedList":
+        """Sub-list made of ``rows``, in that order."""
+        rows = np.asarray(rows)
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return EncodedList(offsets, self.codes[positions], self.vocab)
+
+    def drop(self, tokens) -> "EncodedList":
+        """Same rows without any of ``tokens``."""
+        keep = ~np.isin(self.codes, self.codes_of(tokens))
+        lengths = np.bincount(self.row_ids()[keep], minlength=len(self))
+        return EncodedList(np.concatenate([[0], np.cumsum(lengths)]), self.codes[keep], self.vocab)
+
+    def incidence(self) -> sparse.csr_array:
+        """Sparse ``rows × vocab`` matrix counting each token per row (built once)."""
+        if self._incidence is None:
+            # Private copies: sum_duplicates sorts in place, the memmaps are read-only
+            incidence = sparse.csr_array(
+                (np.ones(len(self.codes), dtype=np.int32), np.array(self.codes), np.array(self.offsets)),
+                shape=(len(self), len(self.vocab)),
+            )
+            incidence.sum_duplicates()
+            self._incidence = incidence
+        return self._incidence
+
+    def top_tokens(self, labels: pd.Series, n: int, exclude=()) -> pd.Series:
+        """The ``n`` most frequent tokens per label, most frequent first.
+
+        ``labels`` is indexed by row, so any labelling of any subset of rows
+        (clusters, popularity buckets...) reuses the same incidence matrix.
+        """
+        values, counts = count_by_label(self.incidence()[np.asarray(labels.index)], labels.to_numpy())
+        counts[:, self.codes_of(exclude)] = 0
+        top = top_columns(counts, n)
+        return pd.Series(
+            [list(self.vocab[cols[counts[i, cols] > 0]]) for i, cols in enumerate(top)],
+            index=pd.Index(values, name=labels.name),
+        )
+
+    def to_tuples(self) -> list[tuple[str, ...]]:
+        """Decode back to one tuple of strings per row (for display)."""
+        tokens = self.vocab[self.codes]
+        return [tuple(tokens[a:b]) for a, b in zip(self.offsets[:-1], self.offsets[1:])]
+
+
+def count_by_label(incidence: sparse.csr_array, labels: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Column sums of ``incidence`` per distinct label.
+
+    Returns ``(values, counts)``: ``counts[i]`` sums the rows labelled
+    ``values[i]``, computed as one ``labels × rows`` indicator product.
+    """
+    values, inverse = np.unique(labels, return_inverse=True)
+    indicator = sparse.csr_array(
+        (np.ones(len(inverse), dtype=np.int64), (inverse, np.arange(len(inverse)))),
+        shape=(len(values), len(inverse)),
+    )
+    return values, (indicator @ incidence).toarray()
+
+
+def top_columns(counts: np.ndarray, n: int) -> np.ndarray:
+    """Column indices of the ``n`` largest values of each row, largest first
+    (ties by increasing column)."""
+    n = min(n, counts.shape[1])
+    if n <= 0:
+        return np.empty((counts.shape[0], 0), dtype=np.intp)
+    # Partial selection of the n best, then a sort of those n only
+    part = np.argpartition(-counts, n - 1, axis=1)[:, :n]
+    order = np.lexsort((part, -np.take_along_axis(counts, part, axis=1)), axis=-1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def map_list(name: str, column: str, manifest: dict | None = None) -> EncodedList:
+    """Read-only :class:`EncodedList` over the memory-mapped ``column`` of ``name``."""
+    entry = require_table(name, manifest)
+    paths = list_paths(name, column, entry)
+    offsets = np.memmap(paths["offsets"], dtype=np.int64, mode="r", shape=(entry["rows"] + 1,))
+    n_codes = int(offsets[-1])
+    codes = (
+        np.memmap(paths["codes"], dtype=np.int32, mode="r", shape=(n_codes,))
+        if n_codes
+        else np.empty(0, dtype=np.int32)
+    )
+    vocab = np.array(json.loads(paths["vocab"].read_text()), dtype=object)
+    return EncodedList(offsets, codes, vocab)
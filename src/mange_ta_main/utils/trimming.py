@@ -0,0 +1,32 @@
+"""Quantile-based outlier trimming.
+
+The bounds of every column are computed in one vectorised pass over the
+full table, and a row is kept when all its values lie within them. Unlike
+trimming one column after another, the result does not depend on the
+column order, and the input frame is never modified.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_QUANTILES = (0.01, 0.99)
+
+
+def quantile_bounds(values: pd.DataFrame, lower: float = DEFAULT_QUANTILES[0], upper: float = DEFAULT_QUANTILES[1]) -> pd.DataFrame:
+    """``lower`` and ``upper`` quantiles of each column (``NaN`` ignored)."""
+    bounds = np.nanquantile(values.to_numpy(dtype=np.float64), [lower, upper], axis=0)
+    return pd.DataFrame(bounds, index=["lower", "upper"], columns=values.columns)
+
+
+def within_bounds(values: pd.DataFrame, bounds: pd.DataFrame) -> np.ndarray:
+    """Mask of the rows whose values all lie within ``bounds``.
+
+    Rows with a missing value in one of the columns are dropped, as a
+    comparison with ``NaN`` is false.
+    """
+    X = values[bounds.columns].to_numpy(dtype=np.float64)
+    return ((X >= bounds.loc["lower"].to_numpy()) & (X <= bounds.loc["upper"].to_numpy())).all(axis=1)
+
+
+def trim(df: pd.DataFrame, columns: list[str], lower: float = DEFAULT_QUANTILES[0], upper: float = DEFAULT_QUANTILES[1]) -> pd.DataFrame:
+    """Rows of ``df`` within the quantile bounds of ``columns``, as a new frame."""
+    return df[within_bounds(df, quantile_bounds(df[columns], lower, upper))]
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The app imports its helpers as ``utils.*`` (Streamlit runs from src/mange_ta_main)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src" / "mange_ta_main"))
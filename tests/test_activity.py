@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.activity import ActivityMatrix, super_core_sweep
+
+
+@pytest.fixture
+def monthly():
+    """Long ``contributor_months`` table: 60 contributors over 2006-2016."""
+    rng = np.random.default_rng(0)
+    months = pd.date_range("2006-01-01", "2016-12-01", freq="MS")
+    rows = []
+    for contributor in range(60):
+        start, length = rng.integers(0, len(months), 2)
+        active = months[start:start + length + 1]
+        for month in rng.choice(active, min(len(active), rng.integers(1, 40)), replace=False):
+            rows.append((contributor, month, int(rng.integers(1, 12))))
+    return pd.DataFrame(rows, columns=["contributor_id", "month", "n_recipes"])
+
+
+def dense_activity(monthly: pd.DataFrame) -> pd.DataFrame:
+    """The page's original contributor × month matrix (``build_activity_matrix``)."""
+    return (
+        monthly.set_index(["contributor_id", "month"])["n_recipes"]
+          .unstack(fill_value=0)
+          .sort_index(axis=1)
+    )
+
+
+def super_core_metrics(activity, cutoff, active_window):
+    """Reference metrics, as computed by the page before the CSR engine."""
+    start, end = pd.Timestamp(active_window[0]), pd.Timestamp(active_window[1])
+    total_recipes = activity.sum(axis=1)
+    active_months = activity.loc[:, (activity.columns >= start) & (activity.columns <= end)].gt(0).sum(axis=1)
+    last_pub = activity.apply(lambda row: row[row > 0].index.max() if (row > 0).any() else pd.NaT, axis=1)
+    late_cols = [c for c in activity.columns if c >= pd.Timestamp(cutoff)]
+    late_share = activity[late_cols].sum(axis=1) / total_recipes.replace(0, np.nan)
+    return pd.DataFrame({
+        "total_recipes": total_recipes,
+        "active_months": active_months,
+        "last_pub": last_pub,
+        "late_share": late_share.fillna(0),
+    })
+
+
+def test_super_core_sweep_matches_threshold_loop(monthly):
+    cutoffs = ["2012-01-01", "2013-01-01"]
+    min_active_months = [3, 6, 12]
+    percentiles = [0.5, 0.9]
+    late_shares = [0.1, 0.3]
+    window = ("2008-01-01", "2014-12-31")
+    sweep = super_core_sweep(
+        ActivityMatrix.from_monthly(monthly), cutoffs, min_active_months, percentiles, late_shares, window,
+    ).set_index(["cutoff", "min_active_months", "percentile_min_recipes", "min_late_share"])
+
+    activity = dense_activity(monthly)
+    recent_start = activity.columns[-1] - pd.DateOffset(months=5)
+    for cutoff in cutoffs:
+        metrics = super_core_metrics(activity, cutoff, window)
+        for months in min_active_months:
+            for percentile in percentiles:
+                min_recipes = np.nanpercentile(metrics["total_recipes"], percentile * 100)
+                for late_share in late_shares:
+                    mask = (
+                        (metrics["last_pub"] >= pd.Timestamp(cutoff))
+                        & (metrics["active_months"] >= months)
+                        & (metrics["total_recipes"] >= min_recipes)
+                        & (metrics["late_share"] >= late_share)
+                    )
+                    row = sweep.loc[(cutoff, months, percentile, late_share)]
+                    assert row["n_super_core"] == mask.sum()
+                    assert row["n_recent"] == (mask & (metrics["last_pub"] >= recent_start)).sum()
+                    assert row["recipe_share"] == pytest.approx(
+                        metrics.loc[mask, "total_recipes"].sum() / metrics["total_recipes"].sum())
+    # The grid is not degenerate: some configurations keep several recent members
+    assert sweep["n_recent"].max() > 1
+
+
+def test_activity_matrix_matches_dense_metrics(monthly):
+    activity = ActivityMatrix.from_monthly(monthly)
+    dense = dense_activity(monthly)
+    window = ("2008-01-01", "2014-12-31")
+    metrics = super_core_metrics(dense, "2013-01-01", window)
+
+    assert activity.contributors.tolist() == dense.index.tolist()
+    assert activity.months.equals(dense.columns)
+    np.testing.assert_array_equal(activity.to_frame().to_numpy(), dense.to_numpy())
+    np.testing.assert_array_equal(activity.totals(), metrics["total_recipes"])
+    np.testing.assert_array_equal(activity.active_months(*window), metrics["active_months"])
+    np.testing.assert_array_equal(activity.last_active(), metrics["last_pub"])
+    np.testing.assert_allclose(activity.late_share("2013-01-01"), metrics["late_share"])
+    np.testing.assert_allclose(
+        activity.rolling_mean(3), dense.T.rolling(3, min_periods=1).mean().T.to_numpy())
+
+
+def test_top_keeps_the_largest_contributors(monthly):
+    activity = ActivityMatrix.from_monthly(monthly)
+    totals = dense_activity(monthly).sum(axis=1)
+    top = activity.top(10)
+    assert sorted(top.totals(), reverse=True) == sorted(totals.nlargest(10), reverse=True)
+    assert top.contributors.is_monotonic_increasing
+
+    # Same matrix as unstacking the rows of those contributors only: the
+    # months where none of them published are dropped
+    dense = dense_activity(monthly[monthly["contributor_id"].isin(top.contributors)])
+    assert len(dense.columns) < len(activity.months)
+    assert top.months.equals(dense.columns)
+    np.testing.assert_array_equal(top.to_frame().to_numpy(), dense.to_numpy())
+    np.testing.assert_allclose(top.rolling_mean(3), dense.T.rolling(3, min_periods=1).mean().T.to_numpy())
@@ -0,0 +1,68 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+from utils import disk_cache
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def modules(tmp_path):
+    """A page-like module calling a helper of a (fake) ``utils`` module."""
+    helper = tmp_path / "helper.py"
+    helper.write_text("def double(x):\n    return 2 * x\n")
+    page = tmp_path / "page.py"
+    page.write_text("from utils._test_helper import double\n\n\ndef compute(x):\n    return double(x)\n")
+    load_module("utils._test_helper", helper)
+    yield helper, load_module("_test_page", page)
+    sys.modules.pop("utils._test_helper")
+    sys.modules.pop("_test_page")
+
+
+def test_editing_a_callee_changes_the_code_hash(modules):
+    helper, page = modules
+    before = disk_cache.source_hash(page.compute)
+    assert disk_cache.source_hash(page.compute) == before
+
+    helper.write_text("def double(x):\n    return x + x\n")
+    stat = helper.stat()
+    os.utime(helper, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert disk_cache.source_hash(page.compute) != before
+
+
+def test_the_code_hash_looks_through_decorators(modules):
+    helper, page = modules
+    wrapped = disk_cache.disk_cache(page.compute)
+    before = disk_cache.source_hash(wrapped)
+    assert before == disk_cache.source_hash(page.compute)
+
+    helper.write_text("def double(x):\n    return x + x\n")
+    stat = helper.stat()
+    os.utime(helper, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert disk_cache.source_hash(wrapped) != before
+
+
+def test_keys_follow_only_the_declared_tables(modules, monkeypatch):
+    _, page = modules
+    versions = {"recipes": "r1", "interactions": "i1"}
+    monkeypatch.setattr(disk_cache, "table_version", lambda name: versions[name])
+    monkeypatch.setattr(disk_cache, "dataset_version", lambda: str(sorted(versions.items())))
+
+    def key(tables):
+        return disk_cache.cache_key(page.compute, "code", (1,), {}, tables)
+
+    recipes_only, whole_store = key(["recipes"]), key(None)
+    versions["interactions"] = "i2"
+    assert key(["recipes"]) == recipes_only
+    assert key(None) != whole_store
+    versions["recipes"] = "r2"
+    assert key(["recipes"]) != recipes_only
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+from threadpoolctl import threadpool_info
+
+from utils.executor import THREADS_PER_JOB, Job, background, report_progress, run_in_background
+
+
+def test_identical_requests_share_one_job():
+    calls = []
+    release = threading.Event()
+
+    def slow(x):
+        calls.append(x)
+        report_progress(0.5, "halfway")
+        release.wait(5)
+        return x * 2
+
+    jobs = []
+    threads = [threading.Thread(target=lambda: jobs.append(run_in_background(slow, 21))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Still running: every request joined the same job
+    assert len({id(job) for job in jobs}) == 1
+    release.set()
+
+    job = jobs[0]
+    assert job.result(5) == 42
+    assert (job.fraction, job.message) == (0.5, "halfway")
+    # Finished: served from the memory cache
+    assert run_in_background(slow, 21) is job
+    assert run_in_background(slow, 22).result(5) == 44
+    assert calls == [21, 22]
+
+
+def test_failed_jobs_are_retried():
+    attempts = []
+
+    @background
+    def flaky():
+        attempts.append(None)
+        if len(attempts) == 1:
+            raise RuntimeError("first attempt")
+        return "ok"
+
+    first = flaky()
+    assert isinstance(first, Job)
+    with pytest.raises(RuntimeError):
+        first.result(5)
+    assert flaky().result(5) == "ok"
+    assert len(attempts) == 2
+
+
+def test_report_progress_outside_a_job_is_a_no_op():
+    report_progress(0.3, "ignored")
+
+
+def test_jobs_run_with_a_bounded_number_of_native_threads():
+    import sklearn.cluster  # noqa: F401, loads scikit-learn's OpenMP runtime
+
+    def native_threads():
+        return {info["user_api"]: info["num_threads"] for info in threadpool_info()}
+
+    assert set(run_in_background(native_threads).result(5).values()) == {THREADS_PER_JOB}
@@ -0,0 +1,85 @@
+import pytest
+import streamlit as st
+
+from utils.graph import Graph
+
+
+@pytest.fixture
+def graph(request):
+    name = request.node.name
+    yield Graph(name)
+    del st.session_state[f"graph:{name}"]
+
+
+def build(graph, calls):
+    """``scaled = values * factor``, ``total = sum(scaled)``, ``label = title``."""
+
+    @graph.node
+    def scaled(values, factor):
+        calls.append("scaled")
+        return [v * factor for v in values]
+
+    @graph.node
+    def total(scaled):
+        calls.append("total")
+        return sum(scaled)
+
+    @graph.node
+    def label(title):
+        calls.append("label")
+        return title.upper()
+
+    return total, label
+
+
+def rerun(name, calls, values=(1, 2, 3), factor=2, title="a"):
+    """One script run: a new Graph over the session state, inputs set again."""
+    graph = Graph(name)
+    graph.input("values", list(values), key=tuple(values))
+    graph.input("factor", factor)
+    graph.input("title", title)
+    total, label = build(graph, calls)
+    return total(), label()
+
+
+def test_only_nodes_downstream_of_a_changed_input_recompute(graph):
+    calls = []
+    assert rerun(graph.name, calls) == (12, "A")
+    assert sorted(calls) == ["label", "scaled", "total"]
+
+    calls.clear()
+    assert rerun(graph.name, calls) == (12, "A")
+    assert calls == []
+
+    assert rerun(graph.name, calls, factor=3) == (18, "A")
+    assert calls == ["scaled", "total"]
+
+    calls.clear()
+    assert rerun(graph.name, calls, factor=3, title="b") == (18, "B")
+    assert calls == ["label"]
+
+
+def test_unknown_dependency_raises(graph):
+    @graph.node
+    def orphan(missing):
+        return missing
+
+    with pytest.raises(KeyError, match="missing"):
+        orphan()
+
+
+def test_editing_a_literal_recomputes_the_node(graph):
+    graph.input("values", [1, 5, 20], key=(1, 5, 20))
+
+    @graph.node
+    def large(values):
+        return [v for v in values if v > 10]
+
+    assert large() == [20]
+
+    # Same bytecode, other constant: the edited node must not serve the old value
+    @graph.node
+    def large(values):  # noqa: F811
+        return [v for v in values if v > 2]
+
+    assert large() == [5, 20]
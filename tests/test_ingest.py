@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import ingest
+from utils.ingest import ingest_csv, sync_csv
+from utils.store import (
+    RAW_STRING_COLUMNS,
+    map_columns,
+    map_list,
+    normalize,
+    read_table,
+    save_manifest,
+    table_dir,
+)
+
+
+def raw_recipes(start: int, n: int) -> pd.DataFrame:
+    """Rows of a RAW_recipes.csv, with quoted lists and multi-line fields."""
+    rng = np.random.default_rng(start)
+
+    def pick(values, k) -> str:
+        return repr([str(v) for v in rng.choice(values, k, replace=False)])
+
+    return pd.DataFrame({
+        "name": [f"recipe {i}" for i in range(start, start + n)],
+        "id": np.arange(start, start + n),
+        "minutes": rng.integers(1, 300, n),
+        "contributor_id": rng.integers(1, 50, n),
+        "submitted": pd.to_datetime(rng.integers(0, 20 * 365, n), unit="D", origin="1999-01-01").strftime("%Y-%m-%d"),
+        "tags": [pick(["main-dish", "dessert", "easy", "vegan", "chicken"], rng.integers(0, 4)) for _ in range(n)],
+        "nutrition": [repr([round(float(v), 1) for v in rng.uniform(0, 100, 7)]) for _ in range(n)],
+        "n_steps": rng.integers(1, 20, n),
+        "steps": [repr(["mix, then stir", "bake"])] * n,
+        "description": ["tasty\nand quick"] * n,
+        "ingredients": [pick(["rice", "salt", "egg"], 2) for _ in range(n)],
+        "n_ingredients": rng.integers(1, 15, n),
+    })
+
+
+def expected(csv_path) -> pd.DataFrame:
+    raw = pd.read_csv(csv_path, dtype={col: str for col in RAW_STRING_COLUMNS["recipes"]})
+    return normalize(raw, "recipes")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # The store lives under Data/ relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_sync_parses_only_appended_rows(store):
+    csv_path = store / "RAW_recipes.csv"
+    raw_recipes(0, 300).to_csv(csv_path, index=False)
+    assert ingest_csv(csv_path, "recipes")["rows"] == 300
+
+    raw_recipes(300, 120).to_csv(csv_path, mode="a", header=False, index=False)
+    stats = sync_csv(csv_path, "recipes")
+    assert stats["rows"] == 120
+    assert sync_csv(csv_path, "recipes")["partitions"] == []
+
+    full = expected(csv_path)
+    stored = read_table("recipes")
+    pd.testing.assert_frame_equal(stored.reset_index(drop=True), full, check_dtype=False)
+    assert stored.index.tolist() == list(range(420))
+
+    mapped = map_columns("recipes", ["id", "minutes", "Calories", "submitted_year"])
+    for col in mapped:
+        np.testing.assert_array_equal(mapped[col].to_numpy(), full[col].to_numpy())
+    assert map_list("recipes", "tags").to_tuples() == [tuple(tags) for tags in full["tags"]]
+
+
+def test_sync_rebuilds_a_rewritten_source(store):
+    csv_path = store / "RAW_recipes.csv"
+    raw_recipes(0, 200).to_csv(csv_path, index=False)
+    ingest_csv(csv_path, "recipes")
+
+    # Same size, other content: the rows already ingested cannot be trusted
+    raw_recipes(1_000, 200).to_csv(csv_path, index=False)
+    assert sync_csv(csv_path, "recipes")["rows"] == 200
+    assert read_table("recipes", ["id"])["id"].tolist() == list(range(1_000, 1_200))
+
+
+def test_rebuild_keeps_the_previous_generation_until_committed(store, monkeypatch):
+    csv_path = store / "RAW_recipes.csv"
+    raw_recipes(0, 200).to_csv(csv_path, index=False)
+    ingest_csv(csv_path, "recipes")
+    old_dir = table_dir("recipes")
+    old_ids = map_columns("recipes", ["id"])["id"]
+
+    def check_old_files(manifest):
+        # Right before the new manifest is saved, the old table is still whole
+        assert table_dir("recipes").exists()
+        assert read_table("recipes", ["id"])["id"].tolist() == list(range(200))
+        save_manifest(manifest)
+
+    monkeypatch.setattr(ingest, "save_manifest", check_old_files)
+    raw_recipes(1_000, 150).to_csv(csv_path, index=False)
+    ingest_csv(csv_path, "recipes")
+
+    assert table_dir("recipes") != old_dir
+    assert not old_dir.exists()
+    assert read_table("recipes", ["id"])["id"].tolist() == list(range(1_000, 1_150))
+    # Arrays mapped before the rebuild stay readable
+    assert old_ids.tolist() == list(range(200))
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from utils.memory_cache import MemoryCache, memory_cache, nbytes
+
+MB = 1024 * 1024
+
+
+def block(mb: float) -> np.ndarray:
+    return np.zeros(int(mb * MB), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("policy", ["lru", "lfu"])
+def test_total_stays_under_budget(policy):
+    cache = MemoryCache(max_mb=5, policy=policy)
+    for i in range(20):
+        cache.put("f", str(i), block(1))
+        assert cache.bytes <= cache.max_bytes
+    stats = cache.stats().loc["f"]
+    assert stats["entries"] == 5
+    assert stats["evictions"] == 15
+    assert stats["bytes"] == cache.bytes
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = MemoryCache(max_mb=3.5, policy="lru")
+    for key in "abc":
+        cache.put("f", key, block(1))
+    cache.get("f", "a")
+    cache.put("f", "d", block(1))
+    assert cache.get("f", "b", None) is None
+    assert all(cache.get("f", key, None) is not None for key in "acd")
+
+
+def test_lfu_evicts_the_least_frequently_used():
+    cache = MemoryCache(max_mb=3.5, policy="lfu")
+    for key in "abc":
+        cache.put("f", key, block(1))
+    for key in "ab":
+        cache.get("f", key)
+    cache.put("f", "d", block(1))
+    assert cache.get("f", "c", None) is None
+    assert all(cache.get("f", key, None) is not None for key in "abd")
+
+
+def test_entries_larger_than_the_budget_are_not_kept():
+    cache = MemoryCache(max_mb=1)
+    cache.put("f", "small", block(0.5))
+    cache.put("f", "big", block(2))
+    assert cache.get("f", "big", None) is None
+    assert cache.get("f", "small", None) is not None
+
+
+def test_file_backed_arrays_count_nothing(tmp_path):
+    path = tmp_path / "values.bin"
+    block(1).tofile(path)
+    assert nbytes(np.memmap(path, dtype=np.uint8, mode="r"))[0] == 0
+    assert nbytes(block(1))[0] == MB
+
+
+def test_decorator_counts_hits_and_misses():
+    cache = MemoryCache(max_mb=1)
+    calls = []
+
+    @memory_cache(cache=cache)
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    assert [square(x) for x in (2, 3, 2, 2)] == [4, 9, 4, 4]
+    assert calls == [2, 3]
+    stats = cache.stats().iloc[0]
+    assert (stats["hits"], stats["misses"]) == (2, 2)
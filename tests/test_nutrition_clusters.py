@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from utils import nutrition_clusters
+from utils.ingest import ingest_csv
+from utils.nutrition_clusters import LABELS_PATH, read_nutrition_clusters, update_nutrition_clusters
+
+from tests.test_ingest import raw_recipes
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # The store lives under Data/ relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(nutrition_clusters.PARAMS, "trim_sample_rows", 100)
+    return tmp_path
+
+
+def test_appended_recipes_are_assigned_without_touching_mapped_files(store):
+    raw_recipes(0, 300).to_csv(store / "recipes.csv", index=False)
+    ingest_csv(store / "recipes.csv", "recipes")
+    assert update_nutrition_clusters() == {"refitted": True, "assigned": 300}
+    labels, pcs = read_nutrition_clusters()
+    before = labels.copy(), pcs.copy()
+    inode = LABELS_PATH.stat().st_ino
+
+    raw_recipes(300, 50).to_csv(store / "delta.csv", index=False)
+    ingest_csv(store / "delta.csv", "recipes", append=True)
+    assert update_nutrition_clusters() == {"refitted": False, "assigned": 50}
+
+    # The arrays mapped before the update still see the previous file
+    assert LABELS_PATH.stat().st_ino != inode
+    np.testing.assert_array_equal(labels, before[0])
+    new_labels, new_pcs = read_nutrition_clusters()
+    assert len(new_labels) == len(new_pcs) == 350
+    np.testing.assert_array_equal(new_labels[:300], before[0])
+    np.testing.assert_array_equal(new_pcs[:300], before[1])
+    assert not list(LABELS_PATH.parent.glob("*.tmp"))
@@ -0,0 +1,86 @@
+import threading
+from pathlib import Path
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from utils import executor
+from utils.ingest import ingest_csv
+from utils.memory_cache import CACHE
+from utils.nutrition_clusters import update_nutrition_clusters
+
+from tests.test_ingest import raw_recipes
+
+PAGES = Path(__file__).resolve().parents[1] / "src" / "mange_ta_main" / "pages"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # The store lives under Data/ relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    raw_recipes(0, 600).to_csv(tmp_path / "recipes.csv", index=False)
+    ingest_csv(tmp_path / "recipes.csv", "recipes")
+    update_nutrition_clusters()
+    # Jobs finished by another test would be served from the memory cache
+    CACHE.clear()
+    return tmp_path
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    """Event holding every background job until it is set."""
+    release = threading.Event()
+    run = executor._run
+
+    def held(*args):
+        release.wait(30)
+        return run(*args)
+
+    monkeypatch.setattr(executor, "_run", held)
+    yield release
+    release.set()
+
+
+def finish(release: threading.Event) -> None:
+    release.set()
+    for job in list(executor._inflight.values()):
+        job.result(30)
+
+
+def texts(at: AppTest) -> str:
+    return "\n".join(e.value for kind in ("header", "subheader", "markdown") for e in at.get(kind))
+
+
+def test_contributor_narrative_is_drawn_while_clusters_are_fitted(store, gate):
+    at = AppTest.from_file(str(PAGES / "Contributor_Activity_Analysis.py"), default_timeout=60).run()
+    assert not at.exception
+    assert at.get("progress")
+    page = texts(at)
+    for title in ["A.3 Choosing the Number of Clusters", "B.1 Contributor Targeting Summary", "C. Conclusion"]:
+        assert title in page
+    assert "strategic core to retain" in page
+    n_charts = len(at.get("plotly_chart"))
+
+    finish(gate)
+    at.run()
+    assert not at.exception
+    assert not at.get("progress")
+    # The clusters and the scores of every configuration are drawn in place
+    assert len(at.get("plotly_chart")) == n_charts + 2
+
+
+def test_healthiness_narrative_is_drawn_while_clusters_are_read(store, gate):
+    at = AppTest.from_file(str(PAGES / "Healthiness.py"), default_timeout=60).run()
+    assert not at.exception
+    assert at.get("progress")
+    page = texts(at)
+    assert "A.2 Cluster summary" in page
+    assert "B. Conclusion" in page
+    assert "PDV, main dishes" not in page and "Key findings" not in page
+
+    finish(gate)
+    at.run()
+    assert not at.exception
+    assert not at.get("progress")
+    page = texts(at)
+    assert "PDV, main dishes" in page or "Key findings" in page
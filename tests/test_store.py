@@ -0,0 +1,50 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.store import EncodedList
+
+
+@pytest.fixture
+def tag_lists():
+    rng = np.random.default_rng(0)
+    tokens = np.array([f"tag-{i}" for i in range(40)])
+    # Skewed frequencies, so the top tokens are mostly, not always, distinct
+    weights = 1 / np.arange(1, len(tokens) + 1)
+    return [list(rng.choice(tokens, rng.integers(0, 8), p=weights / weights.sum())) for _ in range(500)]
+
+
+def encode(lists) -> EncodedList:
+    flat = [token for row in lists for token in row]
+    codes, vocab = pd.factorize(pd.Series(flat, dtype=object))
+    offsets = np.concatenate([[0], np.cumsum([len(row) for row in lists])])
+    return EncodedList(offsets, codes.astype(np.int32), np.asarray(vocab, dtype=object))
+
+
+def test_top_tokens_matches_counter(tag_lists):
+    encoded = encode(tag_lists)
+    rng = np.random.default_rng(1)
+    rows = rng.choice(len(tag_lists), 300, replace=False)
+    labels = pd.Series(rng.integers(0, 4, len(rows)), index=rows, name="cluster")
+    exclude = {"tag-0", "tag-3"}
+
+    top = encoded.top_tokens(labels, 5, exclude=exclude)
+
+    assert top.index.tolist() == sorted(labels.unique())
+    for label, tokens in top.items():
+        counter = Counter(
+            token for row in labels.index[labels == label] for token in tag_lists[row] if token not in exclude
+        )
+        expected = counter.most_common(5)
+        # Ties may come in another order than Counter's: compare counts
+        assert [counter[token] for token in tokens] == [count for _, count in expected]
+        assert len(set(tokens)) == len(tokens)
+
+
+def test_take_and_drop_decode_like_lists(tag_lists):
+    encoded = encode(tag_lists)
+    rows = [5, 2, 2, 499, 0]
+    assert encoded.take(rows).to_tuples() == [tuple(tag_lists[row]) for row in rows]
+    assert encoded.drop({"tag-0"}).to_tuples() == [tuple(t for t in row if t != "tag-0") for row in tag_lists]